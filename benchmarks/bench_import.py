@@ -0,0 +1,73 @@
+# measure the time to import nlpannotator and its backends
+# each import runs in a fresh interpreter, run from the repository root:
+# python benchmarks/bench_import.py --repeat 5
+import argparse
+import statistics
+import subprocess
+import sys
+
+MODULES = [
+    "nlpannotator",
+    "nlpannotator.msomajo",
+    "nlpannotator.mtreetagger",
+    "nlpannotator.mspacy",
+    "nlpannotator.mstanza",
+    "nlpannotator.mflair",
+]
+CODE = (
+    "import sys, time; t = time.perf_counter(); import {}; "
+    "print(time.perf_counter() - t, len(sys.modules))"
+)
+
+
+def time_import(module: str, repeat: int = 5):
+    """Import a module in fresh interpreters.
+
+    Args:
+            module[str]: Name of the module.
+            repeat[int]: Number of imports.
+
+    Returns:
+            tuple: The import times in seconds and the number of loaded modules,
+            None if the module can not be imported."""
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run(
+            [sys.executable, "-c", CODE.format(module)],
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            return None
+        seconds, nmodules = result.stdout.split()
+        times.append(float(seconds))
+    return times, int(nmodules)
+
+
+def main(args=None) -> dict:
+    parser = argparse.ArgumentParser(description="Time the imports of nlpannotator.")
+    parser.add_argument("--repeat", type=int, default=5, help="Imports per module.")
+    args = parser.parse_args(args)
+    results = {}
+    print("{:<28}{:>10}{:>10}{:>10}".format("module", "min [s]", "median", "modules"))
+    for module in MODULES:
+        result = time_import(module, args.repeat)
+        if result is None:
+            print("{:<28}{:>10}".format(module, "missing"))
+            continue
+        times, nmodules = result
+        results[module] = {
+            "min": min(times),
+            "median": statistics.median(times),
+            "modules": nmodules,
+        }
+        print(
+            "{:<28}{:>10.3f}{:>10.3f}{:>10}".format(
+                module, min(times), statistics.median(times), nmodules
+            )
+        )
+    return results
+
+
+if __name__ == "__main__":
+    main()
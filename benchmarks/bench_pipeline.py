@@ -0,0 +1,370 @@
+# measure the throughput and peak memory of the stages of the annotation pipeline
+# on generated corpora, run from the repository root:
+# python benchmarks/bench_pipeline.py --tokens 10000 100000 --save baseline.json
+# python benchmarks/bench_pipeline.py --tokens 10000 100000 --compare benchmarks/baseline.json
+# backends that are not installed or have no model are skipped, the stored baseline
+# in benchmarks/baseline.json is machine dependent and only measures somajo
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# import the package from the repository if it is not installed
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import nlpannotator.base as be  # noqa: E402
+import nlpannotator.main as mn  # noqa: E402
+import nlpannotator.pipe as pe  # noqa: E402
+import nlpannotator.table as tb  # noqa: E402
+
+# the processors of each backend, for the first tool on the text and for the
+# following tools on the tokenized sentences
+BACKENDS = {
+    "somajo": {"sent": "sentencize, tokenize"},
+    "spacy": {"sent": "sentencize, tokenize", "tokens": "tokenize, pos, lemma"},
+    "stanza": {"sent": "sentencize, tokenize", "tokens": "tokenize, pos, lemma"},
+    "treetagger": {"tokens": "tokenize, pos, lemma"},
+    "flair": {"tokens": "pos"},
+}
+WORDS = (
+    "the of and to in is was for that with as on by at from his her it this "
+    "which are be has had not were an their have been one all would there "
+    "what so up out if about who them when make can like time no just him know "
+    "take people into year your good some could see other than then now look "
+    "only come its over think also back after use two how our work first well "
+    "way even new want because any these give day most us corpus annotation "
+    "sentence token parliament debate speaker government argument"
+).split()
+# backends that return a lazy generator, these only sentencize and tokenize while
+# the output is assembled
+LAZY = {"somajo"}
+# relative change of the throughput or peak memory that counts as regression
+THRESHOLD = 0.2
+
+
+def generate_sentences(ntokens: int, seed: int = 42) -> list:
+    """Generate sentences of random words with a final full stop.
+
+    Args:
+            ntokens[int]: Number of tokens including the punctuation.
+            seed[int]: Seed of the random generator, the corpus is reproducible.
+
+    Returns:
+            list: The sentences as lists of tokens."""
+    rng = random.Random(seed)
+    sentences = []
+    count = 0
+    while count < ntokens:
+        length = min(rng.randint(5, 25), ntokens - count)
+        sentence = [rng.choice(WORDS) for _ in range(length - 1)] + ["."]
+        sentence[0] = sentence[0].capitalize()
+        sentences.append(sentence)
+        count += length
+    return sentences
+
+
+def get_text(sentences: list) -> str:
+    """Join the sentences into a text, ten sentences per paragraph."""
+    paragraphs = [
+        " ".join(" ".join(sentence[:-1]) + "." for sentence in sentences[i : i + 10])
+        for i in range(0, len(sentences), 10)
+    ]
+    return "\n".join(paragraphs)
+
+
+def get_table(sentences: list) -> tb.TokenTable:
+    table = tb.TokenTable()
+    for sentence in sentences:
+        table.add_sentence(sentence)
+    return table
+
+
+def get_config(tool: str, processing_type: str, output_format: str = "vrt") -> dict:
+    """Activate the input dict of the package for one tool."""
+    mydict = be.PrepareRun.load_input_dict(str(be.pkg / "data" / "input.json"))
+    mydict["tool"] = tool
+    mydict["processing_option"] = "manual"
+    mydict["processing_type"] = processing_type
+    mydict["advanced_options"]["output_format"] = output_format
+    pe.SetConfig(mydict)
+    return mydict
+
+
+def measure(func, ntokens: int, memory: bool) -> tuple:
+    """Run a stage once and measure its run time or its peak memory.
+
+    tracemalloc only traces the memory allocated by Python, not the memory of
+    the backends' native libraries, and slows the stage down. The time is
+    therefore measured in a separate pass without tracing.
+
+    Args:
+            func[callable]: The stage.
+            ntokens[int]: Number of tokens of the stage, None for stages that do not
+                depend on the tokens, these are measured in seconds only.
+            memory[bool]: Measure the peak memory instead of the run time.
+
+    Returns:
+            tuple: The result of the stage and the measurement."""
+    gc.collect()
+    if memory:
+        tracemalloc.start()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return result, {"peak_mb": peak / 1024**2}
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    if ntokens is None:
+        return result, {"seconds": seconds}
+    return result, {"seconds": seconds, "tokens_per_sec": ntokens / seconds}
+
+
+def fake_tokens(sentences: list) -> list:
+    """Tokens as from treetagger, to measure the alignment without a backend."""
+    mtt = mn.get_backend("treetagger")
+    return [
+        mtt.TreetaggerToken(token, "NN", token.lower())
+        for sentence in sentences
+        for token in sentence
+    ]
+
+
+def run_core(sentences: list, memory: bool, outdir: str) -> dict:
+    """Measure the stages that do not depend on a backend."""
+    ntokens = sum(len(sentence) for sentence in sentences)
+    results = {}
+    # set_config does not depend on the tokens
+    _, results["set_config"] = measure(
+        lambda: get_config("spacy", "sentencize, tokenize, pos, lemma"), None, memory
+    )
+    mtt = mn.get_backend("treetagger")
+    doc = fake_tokens(sentences)
+    out_obj = mtt.OutTreetagger(doc, ["pos", "lemma"], 0, "STR")
+    table, results["iterate_tokens"] = measure(
+        lambda: out_obj.assemble_output_tokens(get_table(sentences)), ntokens, memory
+    )
+    _, results["write_vrt"] = measure(
+        lambda: be.OutObject.write_vrt(os.path.join(outdir, "bench"), table),
+        ntokens,
+        memory,
+    )
+    _, results["write_xml"] = measure(
+        lambda: be.OutObject.write_xml("bench", os.path.join(outdir, "bench"), table),
+        ntokens,
+        memory,
+    )
+    return results
+
+
+def run_backend(tool: str, sentences: list, path_txt: str, memory: bool) -> dict:
+    """Measure the calls of a backend and the assembly of its output.
+
+    The first tool reads the text in chunks as in the pipeline, the following tools
+    get the generated sentences. The call and the assembly of lazy backends are
+    measured as one stage.
+
+    Raises:
+            Exception: If the backend or its model can not be loaded."""
+    ntokens = sum(len(sentence) for sentence in sentences)
+    results = {}
+    processing = BACKENDS[tool]
+    if "sent" in processing:
+        mydict = get_config(tool, processing["sent"])
+        # load the model before measuring
+        mn.call_tool[tool](mydict, "Load the model.", False, "STR")
+        call = lambda: mn.call_tool[tool](  # noqa: E731
+            mydict, mn.get_data(mydict, path_txt), False, "STR"
+        )
+        if tool in LAZY:
+            _, results[tool + ".call_assemble_sent"] = measure(
+                lambda: call().assemble_output_sent(), ntokens, memory
+            )
+        else:
+            out_obj, results[tool + ".call_sent"] = measure(call, ntokens, memory)
+            _, results[tool + ".assemble_output_sent"] = measure(
+                out_obj.assemble_output_sent, ntokens, memory
+            )
+    if "tokens" in processing:
+        mydict = get_config(tool, processing["tokens"])
+        mn.call_tool[tool](mydict, [["Load", "the", "model", "."]], True, "STR")
+        out_obj, results[tool + ".call_tokens"] = measure(
+            lambda: mn.call_tool[tool](mydict, sentences, True, "STR"),
+            ntokens,
+            memory,
+        )
+        _, results[tool + ".assemble_output_tokens"] = measure(
+            lambda: out_obj.assemble_output_tokens(get_table(sentences)),
+            ntokens,
+            memory,
+        )
+    return results
+
+
+def run_pass(sizes: list, tools: list, memory: bool, skipped: dict) -> dict:
+    """Run all stages on corpora of each size.
+
+    Returns:
+            dict: The measurements by stage@tokens."""
+    results = {}
+    for ntokens in sizes:
+        sentences = generate_sentences(ntokens)
+        with tempfile.TemporaryDirectory() as outdir:
+            path_txt = os.path.join(outdir, "bench.txt")
+            with open(path_txt, "w", encoding="utf-8") as f:
+                f.write(get_text(sentences))
+            stages = run_core(sentences, memory, outdir)
+            for tool in tools:
+                if tool in skipped:
+                    continue
+                try:
+                    stages.update(run_backend(tool, sentences, path_txt, memory))
+                except Exception as error:
+                    skipped[tool] = "{}: {}".format(type(error).__name__, error)
+                    print(
+                        "Skipping {} - {}".format(tool, skipped[tool]), file=sys.stderr
+                    )
+        for stage, result in stages.items():
+            results["{}@{}".format(stage, ntokens)] = result
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float = THRESHOLD) -> list:
+    """Find the stages that are slower or use more memory than in the baseline.
+
+    The throughput is compared for the stages that are measured per token, the
+    stages measured in seconds only are compared by their peak memory.
+
+    Args:
+            results[dict]: The measurements by stage@tokens.
+            baseline[dict]: The stored measurements.
+            threshold[float]: Relative change that counts as regression.
+
+    Returns:
+            list: Description of each regression."""
+    regressions = []
+    for key, result in results.items():
+        old = baseline.get(key)
+        if old is None:
+            continue
+        if "tokens_per_sec" in result and "tokens_per_sec" in old:
+            change = result["tokens_per_sec"] / old["tokens_per_sec"] - 1
+            if change < -threshold:
+                regressions.append("{}: throughput {:+.0%}".format(key, change))
+        if result.get("peak_mb") and old.get("peak_mb"):
+            change = result["peak_mb"] / old["peak_mb"] - 1
+            if change > threshold:
+                regressions.append("{}: peak memory {:+.0%}".format(key, change))
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    print(
+        "{:<44}{:>12}{:>14}{:>12}".format(
+            "stage@tokens", "time [s]", "tokens/s", "peak [MB]"
+        )
+    )
+    for key, result in results.items():
+        print(
+            "{:<44}{:>12.3f}{:>14}{:>12}".format(
+                key,
+                result["seconds"],
+                (
+                    "{:.0f}".format(result["tokens_per_sec"])
+                    if "tokens_per_sec" in result
+                    else "-"
+                ),
+                "{:.1f}".format(result["peak_mb"]) if "peak_mb" in result else "-",
+            )
+        )
+
+
+def main(args=None) -> dict:
+    parser = argparse.ArgumentParser(
+        description="Measure the stages of the nlpannotator pipeline."
+    )
+    parser.add_argument(
+        "--tokens",
+        type=int,
+        nargs="+",
+        default=[10000, 100000],
+        help="Sizes of the generated corpora, e.g. 10000 1000000 10000000.",
+    )
+    parser.add_argument(
+        "--tools",
+        nargs="+",
+        default=list(BACKENDS),
+        choices=list(BACKENDS),
+        help="Backends to measure.",
+    )
+    # a plain flag pair, argparse.BooleanOptionalAction needs python 3.9
+    parser.add_argument(
+        "--memory",
+        dest="memory",
+        action="store_true",
+        default=True,
+        help="Measure the peak memory in a second pass (default).",
+    )
+    parser.add_argument(
+        "--no-memory",
+        dest="memory",
+        action="store_false",
+        help="Skip the memory pass.",
+    )
+    parser.add_argument("--save", help="Store the results as baseline .json file.")
+    parser.add_argument("--compare", help="Compare to a baseline .json file.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=THRESHOLD,
+        help="Relative change that counts as regression.",
+    )
+    parser.add_argument(
+        "--verbose", action="store_true", help="Show the output of the tools."
+    )
+    args = parser.parse_args(args)
+    skipped = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(
+        sys.stdout if args.verbose else devnull
+    ):
+        results = run_pass(args.tokens, args.tools, False, skipped)
+        if args.memory:
+            peaks = run_pass(args.tokens, args.tools, True, skipped)
+            for key, peak in peaks.items():
+                if key in results:
+                    results[key].update(peak)
+    print_results(results)
+    for tool, reason in skipped.items():
+        print("skipped {}: {}".format(tool, reason))
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "machine": platform.machine(),
+                    "results": results,
+                },
+                f,
+                indent=1,
+            )
+        print("Saved baseline {}".format(args.save))
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print("REGRESSION {}".format(regression))
+        if regressions:
+            sys.exit(1)
+        print("No regressions against {}".format(args.compare))
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,28 @@
 # __init__.py
+import importlib
 from .main import *
 from .base import *
 from .pipe import *
-from .msomajo import *
-from .mspacy import *
-from .mstanza import *
-from .mtreetagger import *
-from .mflair import *
+
+# the backends are imported when one of their names is used, so that importing
+# the package does not load spacy, stanza, flair, ... for a job that does not need them
+_backend_names = {
+    "MySomajo": "msomajo",
+    "OutSomajo": "msomajo",
+    "MySpacy": "mspacy",
+    "OutSpacy": "mspacy",
+    "MyStanza": "mstanza",
+    "OutStanza": "mstanza",
+    "MyTreetagger": "mtreetagger",
+    "OutTreetagger": "mtreetagger",
+    "TreetaggerToken": "mtreetagger",
+    "MyFlair": "mflair",
+    "OutFlair": "mflair",
+}
+
+
+def __getattr__(name):
+    if name in _backend_names:
+        module = importlib.import_module("." + _backend_names[name], __name__)
+        return getattr(module, name)
+    raise AttributeError("module {} has no attribute {}".format(__name__, name))
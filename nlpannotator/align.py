@@ -0,0 +1,165 @@
+# align the tokens of different tools on character offsets
+# the offsets count the characters of the tokens without whitespace, so that
+# the alignment does not depend on how the tools handle spaces and linebreaks
+
+# number of characters to look ahead and back if the texts of the tools differ
+ALIGN_WINDOW = 100
+
+
+def compact(text: str) -> str:
+    """Remove all whitespace from a token."""
+    return "".join(text.split())
+
+
+def get_spans(texts: list) -> tuple:
+    """Get the character spans of the tokens in the concatenated text.
+
+    Args:
+            texts[list]: Token texts.
+
+    Returns:
+            tuple: The concatenated text and a list of (start, end) for each token."""
+    spans = []
+    pos = 0
+    for text in texts:
+        spans.append((pos, pos + len(text)))
+        pos += len(text)
+    return "".join(texts), spans
+
+
+def locate(base_text: str, tool_texts: list, window: int = ALIGN_WINDOW) -> list:
+    """Find the start of each tool token in the concatenated text of the base tokens.
+
+    While the texts agree, the tokens are placed one after the other. If a tool token
+    differs from the base text, it is searched for within window characters, and the
+    placement of the following tokens is shifted accordingly.
+
+    Args:
+            base_text[str]: Concatenated text of the base tokens.
+            tool_texts[list]: Token texts of the tool.
+            window[int]: Number of characters to search if the texts differ.
+
+    Returns:
+            list: The start of each tool token, None if it could not be placed."""
+    starts = []
+    # position where the next tool token is expected and the end of the last placed token
+    pos = 0
+    last_end = 0
+    for text in tool_texts:
+        if not text:
+            starts.append(None)
+            continue
+        if base_text.startswith(text, pos):
+            start = pos
+        else:
+            # look ahead first, then back but not before the last placed token
+            start = base_text.find(text, pos, pos + window + len(text))
+            if start < 0:
+                start = base_text.rfind(
+                    text, max(last_end, pos - window), pos + len(text) - 1
+                )
+        if start < 0:
+            # keep the offsets running, the next token may match again
+            starts.append(None)
+            pos += len(text)
+            continue
+        starts.append(start)
+        pos = start + len(text)
+        last_end = pos
+    return starts
+
+
+def match_positions(index: list, base_texts: list, tool_texts: list, starts: list):
+    """Pair the base tokens and the tool tokens that could not be aligned on their
+    characters by their position between aligned neighbours.
+
+    This aligns the tokens that a tool normalizes, ie quotes or urls. The tokens
+    in a gap are only paired if there are as many base tokens as tool tokens.
+
+    Args:
+            index[list]: The index of the tool token for each base token, the
+                pairs are filled in.
+            base_texts[list]: Token texts of the base tokenization without whitespace.
+            tool_texts[list]: Token texts of the tool without whitespace.
+            starts[list]: The start of each tool token, None if it was not placed.
+
+    Returns:
+            int: Number of base tokens aligned by their position."""
+    matched = 0
+    gap = []
+    # the last aligned tool token
+    last = -1
+    for i in range(len(index) + 1):
+        if i < len(index) and index[i] is None:
+            if base_texts[i]:
+                gap.append(i)
+            continue
+        j = index[i] if i < len(index) else len(tool_texts)
+        tool_gap = [
+            k for k in range(last + 1, j) if starts[k] is None and tool_texts[k]
+        ]
+        if gap and len(gap) == len(tool_gap):
+            for base_i, k in zip(gap, tool_gap):
+                index[base_i] = k
+            matched += len(gap)
+        gap = []
+        last = max(last, j)
+    return matched
+
+
+def align_tokens(base_texts: list, tool_texts: list, window: int = ALIGN_WINDOW):
+    """Map the tokens of a tool onto the base tokenization in linear time.
+
+    Each base token is annotated by the tool token that covers its first character,
+    or if there is none, by the first tool token that starts within the base token.
+    Split tokens (several tool tokens in one base token) are annotated by their first
+    part, merged tokens (one tool token covering several base tokens) annotate all
+    of the base tokens. Tokens that are not found in the text are paired by their
+    position, see match_positions.
+
+    Args:
+            base_texts[list]: Token texts of the base tokenization.
+            tool_texts[list]: Token texts of the tool.
+            window[int]: Number of characters to search if the texts differ.
+
+    Returns:
+            tuple: The index of the tool token for each base token, None if unaligned,
+            and a dict with the alignment statistics."""
+    base_texts = [compact(text) for text in base_texts]
+    base_text, base_spans = get_spans(base_texts)
+    tool_texts = [compact(text) for text in tool_texts]
+    starts = locate(base_text, tool_texts, window)
+    # only keep the tool tokens that could be placed
+    tool_spans = [
+        (start, start + len(text), j)
+        for j, (start, text) in enumerate(zip(starts, tool_texts))
+        if start is not None
+    ]
+    stats = {"tokens": len(base_texts), "exact": 0, "split": 0, "merged": 0}
+    stats["unaligned"] = 0
+    stats["tool_unplaced"] = sum(
+        1 for start, text in zip(starts, tool_texts) if start is None and text
+    )
+    index = []
+    k = 0
+    for start, end in base_spans:
+        # skip the tool tokens that end before this base token
+        while k < len(tool_spans) and tool_spans[k][1] <= start:
+            k += 1
+        if start == end or k == len(tool_spans) or tool_spans[k][0] >= end:
+            # whitespace token or no tool token overlapping
+            index.append(None)
+            stats["unaligned"] += 1
+            continue
+        tool_start, tool_end, j = tool_spans[k]
+        index.append(j)
+        if tool_start == start and tool_end == end:
+            stats["exact"] += 1
+        elif tool_start <= start and tool_end >= end:
+            stats["merged"] += 1
+        else:
+            stats["split"] += 1
+    stats["position"] = match_positions(index, base_texts, tool_texts, starts)
+    stats["unaligned"] -= stats["position"]
+    stats["tool_unplaced"] -= stats["position"]
+    return index, stats
@@ -1,10 +1,26 @@
 # the base class and utilities are contained in this module
+import copy
 import json
 import jsonschema
 import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from types import MappingProxyType
 import importlib_resources
+import nlpannotator.align as al
+import nlpannotator.table as tb
 
 pkg = importlib_resources.files("nlpannotator")
+# default maximum number of characters in a chunk of input text
+CHUNK_SIZE = 100000
+# separator of the paragraphs in a chunk, read by the tools as paragraph break
+PARAGRAPH_SEP = "\n\n"
+# default maximum number of pipelines kept in the model pool
+MAX_MODELS = 4
 
 
 class PrepareRun:
@@ -21,6 +37,32 @@ class PrepareRun:
         # as this method is not available on all os's
         return len(os.sched_getaffinity(0))
 
+    @staticmethod
+    def get_memory() -> float:
+        """Find out the resident memory of the current process in MB.
+        Returns 0 if this is not available on the os."""
+        try:
+            with open("/proc/self/statm") as f:
+                pages = int(f.read().split()[1])
+        except (OSError, IndexError, ValueError):
+            return 0.0
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+
+    @staticmethod
+    def get_processes(mydict: dict, subdict: dict) -> int:
+        """Find out how many processes a tool should use.
+
+        Args:
+                mydict[dict]: The input dictionary.
+                subdict[dict]: The dictionary of the tool, may set n_process directly.
+        """
+
+        if subdict.get("n_process"):
+            return subdict["n_process"]
+        if mydict["advanced_options"].get("multiprocessing", False):
+            return PrepareRun.get_cores()
+        return 1
+
     @staticmethod
     def get_text(path: str) -> str:
         """Convenience function to read in data from specified path as string.
@@ -32,6 +74,113 @@ class PrepareRun:
             data = input.read().replace("\n", "")
         return data
 
+    @staticmethod
+    def get_chunks(path: str, chunk_size: int = CHUNK_SIZE, paragraphs: bool = False):
+        """Generator to read in data from specified path in chunks of text.
+
+        Lines are joined with a space, so that words are not glued together
+        across line breaks. Paragraphs are separated by empty lines and are
+        only split between chunks if they are longer than chunk_size. Within a
+        chunk the paragraphs are joined with PARAGRAPH_SEP, so that the tools do
+        not run sentences across the paragraph boundary.
+
+        Args:
+                path[str]: Path to data.
+                chunk_size[int]: Maximum number of characters per chunk.
+                paragraphs[bool]: Yield each paragraph as separate chunk."""
+
+        with open(path, "r") as input:
+            yield from PrepareRun.split_chunks(input, chunk_size, paragraphs)
+
+    @staticmethod
+    def split_chunks(lines, chunk_size: int = CHUNK_SIZE, paragraphs: bool = False):
+        """Generator to split lines of text into chunks, see get_chunks.
+
+        Args:
+                lines[iterable]: Lines of text, ie an open file.
+                chunk_size[int]: Maximum number of characters per chunk.
+                paragraphs[bool]: Yield each paragraph as separate chunk."""
+
+        chunk = ""
+        for paragraph in PrepareRun._get_paragraphs(lines):
+            if chunk and (
+                paragraphs
+                or len(chunk) + len(PARAGRAPH_SEP) + len(paragraph) > chunk_size
+            ):
+                yield chunk
+                chunk = ""
+            if len(paragraph) > chunk_size:
+                # the last piece may still be filled up with the next paragraph
+                *pieces, chunk = PrepareRun._split_paragraph(paragraph, chunk_size)
+                yield from pieces
+            elif chunk:
+                chunk += PARAGRAPH_SEP + paragraph
+            else:
+                chunk = paragraph
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def _get_paragraphs(input):
+        """Join lines of text into paragraphs."""
+        lines = []
+        for line in input:
+            line = line.strip()
+            if line:
+                lines.append(line)
+            elif lines:
+                yield " ".join(lines)
+                lines = []
+        if lines:
+            yield " ".join(lines)
+
+    @staticmethod
+    def _split_paragraph(paragraph: str, chunk_size: int) -> list:
+        """Split a paragraph that is too long for one chunk at whitespace."""
+        pieces = []
+        while len(paragraph) > chunk_size:
+            cut = paragraph.rfind(" ", 0, chunk_size + 1)
+            if cut <= 0:
+                cut = chunk_size
+            pieces.append(paragraph[:cut])
+            paragraph = paragraph[cut:].lstrip()
+        if paragraph:
+            pieces.append(paragraph)
+        return pieces
+
+    @staticmethod
+    def as_chunks(data) -> list:
+        """Convenience function to treat a single string as one chunk of text.
+
+        Args:
+                data[str or iterable]: Text as string or chunks of text."""
+
+        if isinstance(data, str):
+            return [data]
+        return data
+
+    @staticmethod
+    def as_text(sentence) -> str:
+        """Convenience function to join the tokens of a pretokenized sentence.
+
+        Args:
+                sentence[str or list]: Sentence as string or list of tokens."""
+
+        if isinstance(sentence, str):
+            return sentence
+        return " ".join(sentence)
+
+    @staticmethod
+    def as_tokens(sentence) -> list:
+        """Convenience function to split a sentence string into tokens at whitespace.
+
+        Args:
+                sentence[str or list]: Sentence as string or list of tokens."""
+
+        if isinstance(sentence, str):
+            return sentence.split()
+        return sentence
+
     # load the dictionary
     @staticmethod
     def load_input_dict(name: str) -> dict:
@@ -44,17 +193,166 @@ class PrepareRun:
             mydict = json.load(f)
         return mydict
 
-    # load the dictionary schema and validate against
+    # validate against the dictionary schema, compiled once in the registry
     @staticmethod
     def validate_input_dict(dict_in: dict) -> None:
-        file = pkg / "data" / "input_schema.json"
-        with file.open() as f:
-            myschema = json.load(f)
-        jsonschema.validate(instance=dict_in, schema=myschema)
+        error = jsonschema.exceptions.best_match(
+            registry.validator.iter_errors(dict_in)
+        )
+        if error is not None:
+            raise error
 
 
+class ConfigRegistry:
+    """Registry of the configuration files of the package, that are loaded once
+    per process.
+
+    The attribute names are immutable mappings, so that they can be shared between
+    all output objects. The input schema is kept as compiled validator."""
+
+    def __init__(self):
+        self._names = None
+        self._validator = None
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def freeze(mydict: dict) -> MappingProxyType:
+        """Convert a nested dict into read-only mappings."""
+        return MappingProxyType(
+            {
+                key: ConfigRegistry.freeze(value) if type(value) == dict else value
+                for key, value in mydict.items()
+            }
+        )
+
+    @property
+    def names(self) -> MappingProxyType:
+        """The attribute names for the tools from attribute_names.json."""
+        if self._names is None:
+            with self.lock:
+                if self._names is None:
+                    file = pkg / "data" / "attribute_names.json"
+                    self._names = self.freeze(PrepareRun.load_input_dict(file))
+        return self._names
+
+    @property
+    def validator(self):
+        """The jsonschema validator for input_schema.json."""
+        if self._validator is None:
+            with self.lock:
+                if self._validator is None:
+                    file = pkg / "data" / "input_schema.json"
+                    with file.open() as f:
+                        myschema = json.load(f)
+                    cls = jsonschema.validators.validator_for(myschema)
+                    cls.check_schema(myschema)
+                    self._validator = cls(myschema)
+        return self._validator
+
+
+# the configuration registry of the process
+registry = ConfigRegistry()
+
+
+class ModelPool:
+    """Pool of loaded pipelines that is shared within the process, so that
+    repeated runs do not reload the models.
+
+    Pipelines are identified by the tool and the tool dictionary, which contains the
+    model, processors and configuration. If the pool exceeds its budget, the least
+    recently used pipelines are dropped.
+
+    Args:
+        max_models[int]: Maximum number of pipelines kept in the pool.
+        max_memory[float]: Maximum memory in MB of the pipelines kept in the pool,
+            estimated from the resident memory when loading. None for no limit.
+    """
+
+    def __init__(self, max_models: int = MAX_MODELS, max_memory: float = None):
+        self.max_models = max_models
+        self.max_memory = max_memory
+        # key -> (pipeline object, memory in MB)
+        self.models = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def configure(self, max_models: int = None, max_memory: float = None) -> None:
+        """Update the budget of the pool and drop pipelines if needed."""
+        with self.lock:
+            if max_models is not None:
+                self.max_models = max_models
+            if max_memory is not None:
+                self.max_memory = max_memory
+            self._evict()
+
+    @staticmethod
+    def get_key(tool: str, subdict: dict) -> str:
+        """Build the key of a pipeline from the tool and its settings."""
+        return tool + ":" + json.dumps(subdict, sort_keys=True, default=str)
+
+    def get(self, tool: str, subdict: dict, loader):
+        """Get a pipeline from the pool, load it if not found.
+
+        Args:
+                tool[str]: Name of the tool.
+                subdict[dict]: The dictionary of the tool.
+                loader[callable]: Loads the pipeline from the dictionary, ie MySpacy."""
+
+        key = self.get_key(tool, subdict)
+        with self.lock:
+            if key in self.models:
+                self.hits += 1
+                self.models.move_to_end(key)
+                return self.models[key][0]
+            self.misses += 1
+            print("Loading new {} pipeline into model pool.".format(tool))
+            memory = PrepareRun.get_memory()
+            # the loaders may change the dict, keep the key intact
+            obj = loader(copy.deepcopy(subdict))
+            memory = max(PrepareRun.get_memory() - memory, 0.0)
+            self.models[key] = (obj, memory)
+            self._evict()
+            return obj
+
+    @property
+    def memory(self) -> float:
+        """Estimated memory of the pipelines in the pool in MB."""
+        return sum(memory for _, memory in self.models.values())
+
+    def _evict(self) -> None:
+        # always keep the most recent pipeline
+        while len(self.models) > 1 and (
+            len(self.models) > self.max_models
+            or (self.max_memory is not None and self.memory > self.max_memory)
+        ):
+            key, (obj, _) = self.models.popitem(last=False)
+            print("Dropping pipeline {} from model pool.".format(key.split(":")[0]))
+            self.release(obj)
+
+    @staticmethod
+    def release(obj) -> None:
+        """Free the resources of a dropped pipeline, ie stop its worker processes."""
+        if hasattr(obj, "release"):
+            obj.release()
+
+    def clear(self) -> None:
+        """Drop all pipelines from the pool."""
+        with self.lock:
+            for obj, _ in self.models.values():
+                self.release(obj)
+            self.models.clear()
+
+
+# the model pool of the process
+model_pool = ModelPool()
+
 # set the string to be used for undefined tags
 NOT_DEF = " "
+# buffer size for writing the output files
+WRITE_BUFFER = 1024 * 1024
+# translation table for characters that need to be escaped in xml
+XML_ESCAPE = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})
 
 
 class OutObject:
@@ -75,11 +373,27 @@ class OutObject:
         # just one doc object for whole text or multiple objects per sentence
         # get the attribute names for the different tools
         self.attrnames = self.get_names()
-        # ptags does the same case selection as OutObject.collect_results, so the order
-        # of .vrt and this list should always be identical. If you change one
-        # MAKE SURE to also change the other.
+        # names of the columns that the tool added to the table, as in get_ptags
         self.ptags = []
 
+    def doc_list(self) -> list:
+        """Return the doc objects as list, also if the text was processed as one doc."""
+        if type(self.doc) == list:
+            return self.doc
+        return [self.doc]
+
+    def sentence_counts(self) -> list:
+        """Number of sentences of each doc, one doc for each chunk of the text.
+
+        Returns:
+                list: The numbers, None if the tool does not keep the chunks apart."""
+        if "sentence" not in self.attrnames:
+            return None
+        return [
+            len(list(getattr(doc, self.attrnames["sentence"])))
+            for doc in self.doc_list()
+        ]
+
     @staticmethod
     def open_outfile(outname: str):
         """Initialize output file.
@@ -92,25 +406,23 @@ class OutObject:
         return f
 
     def iterate(self, out, sent):
-        """Iterate through the tokens in a sentence."""
-        for token in sent:
-            line = token.text
-            out.append(line + "\n")
+        """Iterate through the tokens in a sentence and add them to the table."""
+        out.add_sentence([token.text for token in sent])
         return out
 
-    def assemble_output_sent(self) -> list:
+    def assemble_output_sent(self) -> tb.TokenTable:
         """Template function to assemble output for tool at sentence level."""
 
-        # insert sentence symbol <s> before and </s> after every sentence
+        # the table inserts sentence symbol <s> before and </s> after every sentence
         if "sentence" not in self.attrnames:
             raise KeyError("Error: Sentence-Key not in obj.attrnames.")
         # leaving start in as may be needed for xml writing
         self.tstart = 0
-        out = []
-        for sent in getattr(self.doc, self.attrnames["sentence"]):
-            out.append("<s>\n")
-            out = self.iterate(out, sent)
-            out.append("</s>\n")
+        out = tb.TokenTable()
+        # the text may have been processed in chunks, one doc per chunk
+        for doc in self.doc_list():
+            for sent in getattr(doc, self.attrnames["sentence"]):
+                out = self.iterate(out, sent)
         return out
 
     def assemble_output_tokens(self, out) -> list:
@@ -118,71 +430,60 @@ class OutObject:
         # this needs to be done module-specific for now and is set in each subclass
         return out
 
-    def iterate_tokens(self, out, token_list):
-        """Assemble output for tool at token level."""
-        token_list_out = self.out_shortlist(out)
-        # now compare the tokens in out with the tokens from the current tool
-        for token_tool, token_out in zip(token_list, token_list_out):
-            mylen = len(token_tool.text)
-            # print("Checking for tokens {} {}".format(token_tool.text, token_out[0]))
-            # check that the text is the same
-            if token_tool.text != token_out[0][0:mylen]:
-                raise RuntimeError(
-                    "Found different token than in out! - {} and {}. Please check your inputs!".format(
-                        token_tool.text, token_out[0][0:mylen]
-                    )
-                )
+    def iterate_tokens(self, out, token_list, word_list=None) -> tb.TokenTable:
+        """Assemble output for tool at token level.
+
+        The tokens of the tool are aligned to the tokens in out on character offsets,
+        so that differing tokenizations do not stop the run. Each requested tag is
+        added to the table as one column, tokens in out that the tool did not
+        annotate get undefined tags.
+
+        Args:
+                out[TokenTable]: Table containing the collected output, lines of .vrt
+                    output are converted to a table.
+                token_list[list]: Tokens of the tool.
+                word_list[list]: Words of the tool to take the tags from, if these
+                    differ from the tokens."""
+        if word_list is None:
+            word_list = token_list
+        if not isinstance(out, tb.TokenTable):
+            out = tb.TokenTable.from_lines(out)
+        index, self.alignment = al.align_tokens(
+            out.tokens, [token_tool.text for token_tool in token_list]
+        )
+        ptags = self.get_ptags()
+        columns = {ptag: [] for ptag in ptags}
+        for j in index:
+            if j is not None:
+                tags = self.collect_tags(token_list[j], word_list[j], ptags)
             else:
-                line = self.collect_results(token_tool, 0, token_tool)
-                # now replace the respective token with annotated token
-                out[token_out[1]] = out[token_out[1]].replace("\n", "") + line + "\n"
-                # note that this will not add a linebreak for <s> and <s\> -
-                # linebreaks are handled by sentencizer
-                # we expect that sentencizer runs
-                # TODO be able to feed only one sentence
+                tags = dict.fromkeys(ptags, NOT_DEF)
+            for ptag in ptags:
+                columns[ptag].append(tags[ptag])
+        for ptag in ptags:
+            # a column of the same name in the table is kept, the new one numbered
+            name = out.add_column(ptag, columns[ptag])
+            if name not in self.ptags:
+                self.ptags.append(name)
+        self.print_alignment()
         return out
 
+    def print_alignment(self) -> None:
+        """Report how the tokens of the tool were aligned."""
+        print(
+            "Aligned {tokens} tokens: {exact} exact, {split} split, {merged} merged, "
+            "{position} by position, {unaligned} unaligned; "
+            "{tool_unplaced} tool tokens not found.".format(**self.alignment)
+        )
+
     def token_list(self, myobj) -> list:
         """Convert tokens from object into list."""
         return [token for token in myobj]
 
-    def out_shortlist(self, out: list) -> list:
-        """Remove the structural attributes before and after sentence to compare tokens."""
-        out = [
-            (token.strip(), i)
-            for i, token in enumerate(out)
-            if token.strip() != "<s>" and token.strip() != "</s>"
-        ]
-        return out
-
-    def _compare_tokens(self, token1, token2):
-        """Find out if tokens from previous and current tool are identical."""
-        return token1 == token2
-
-    @staticmethod
-    def get_names() -> dict:
-        """Load attribute names for specific tools."""
-        file = pkg / "data" / "attribute_names.json"
-        mydict = PrepareRun.load_input_dict(file)
-        return mydict
-
-    # This is currently not working properly
-    # as cwb requires a semi-vrt format also for the xml
     @staticmethod
-    def switch_style(line: dict) -> str:
-        """Switch style from DICT to STR"""
-
-        output = ""
-        for i, (key, value) in enumerate(line.items()):
-            # don't repeat the token, we already got it from sentencize/tokenize
-            # a temporary fix, later we will not add this to the dict in the first place
-            if key != "text":
-                # strip the id, and don't append \t for the "first" item
-                if key != "id" and i > 1:
-                    output += "\t{}".format(value)
-                elif key != "id" and i == 1:
-                    output += "{}".format(value)
-        return output
+    def get_names() -> MappingProxyType:
+        """Get the attribute names for specific tools, read-only and loaded once."""
+        return registry.names
 
     def get_stags(self) -> list:
         stags = []
@@ -192,34 +493,37 @@ class OutObject:
             stags = None
         return stags
 
-    def collect_results(self, token, tid: int, word) -> dict or str:
-
-        """Function to collect requested tags for tokens after applying pipeline to data.
-
-        Args:
-                style[str]. Return line as string (STR) for .vrt or dict (DICT) for .xml."""
-
-        # always get token id and token text
-        line = {"id": str(tid), "text": token.text}
-        # put in correct order - first pos, then lemma, then ner
-        # order matters for encoding
-
+    def get_ptags(self) -> list:
+        """Get the ptags requested from the tool.
+        Put in correct order - first pos, then lemma, then ner - order matters for encoding.
+        """
+        ptags = []
         if self.attrnames["proc_pos"] in self.jobs:
-            if "pos" not in self.ptags:
-                self.ptags.append("pos")
-            line["POS"] = self.grab_tag(word)
-
+            ptags.append("pos")
         if self.attrnames["proc_lemma"] in self.jobs:
-            if "lemma" not in self.ptags:
-                self.ptags.append("lemma")
-            line["LEMMA"] = self.grab_lemma(word, self.attrnames["lemma"])
-
+            ptags.append("lemma")
         if "ner" in self.jobs:
-            if "ner" not in self.ptags:
-                self.ptags.append("NER")
-            line["NER"] = self.grab_ent(token)
+            ptags.append("ner")
+        return ptags
 
-        return self.switch_style(line)
+    def collect_tags(self, token, word, ptags: list) -> dict:
+        """Collect the requested tags of a token.
+
+        Args:
+                token: Token object of the tool.
+                word: Word object of the tool to take pos and lemma from.
+                ptags[list]: Requested tags, from get_ptags.
+
+        Returns:
+                dict: The tag for each of the ptags."""
+        tags = {}
+        if "pos" in ptags:
+            tags["pos"] = self.grab_tag(word)
+        if "lemma" in ptags:
+            tags["lemma"] = self.grab_lemma(word, self.attrnames["lemma"])
+        if "ner" in ptags:
+            tags["ner"] = self.grab_ent(token)
+        return tags
 
     def grab_tag(self, word):
         """Get the pos."""
@@ -258,33 +562,131 @@ class OutObject:
         return out_string
 
     @staticmethod
-    def write_vrt(outname: str, out: list) -> None:
-        """Function to write list to a .vrt file.
+    def is_structural(line: str) -> bool:
+        """Check if a line of the output is one of the structural attributes the
+        output is written with, <s> or <text>, and not a token. Tokens that look
+        like markup, such as <b>, are not structural."""
+        return tb.OUT_STRUCTURE.match(line.strip()) is not None
+
+    @staticmethod
+    def vrt_lines(out):
+        """Generator to purge the tokens for the .vrt file one line at a time.
+
+        Args:
+                out[iterable]: Lines for the .vrt file as strings."""
+        for line in out:
+            if OutObject.is_structural(line):
+                # keep the spaces between the attributes of structures
+                yield line
+            else:
+                yield OutObject.purge(line)
+
+    @staticmethod
+    def text_lines(texts):
+        """Generator to enclose the lines of several documents in <text id="...">.
+
+        Args:
+                texts[iterable]: Tuples of the text id and the lines of the document."""
+        for text_id, out in texts:
+            yield '<text id="{}">\n'.format(text_id.translate(XML_ESCAPE))
+            yield from out
+            yield "</text>\n"
+
+    @staticmethod
+    def read_lines(filename: str):
+        """Generator for the lines of a file read through a buffered file handle."""
+        with open(filename, "r", encoding="utf-8", buffering=WRITE_BUFFER) as file:
+            yield from file
+
+    @staticmethod
+    def write_lines(filename: str, lines) -> dict:
+        """Function to stream lines to a file through a buffered file handle.
+
+        Args:
+                filename[str]: Name of the file to be written.
+                lines[iterable]: Lines as strings, list or generator.
+
+        Returns:
+                dict: Number of tokens and bytes written."""
+        tokens = 0
+        with open(filename, "w", encoding="utf-8", buffering=WRITE_BUFFER) as file:
+            for line in lines:
+                if line.strip() and not OutObject.is_structural(line):
+                    tokens += 1
+                file.write(line)
+        return {"tokens": tokens, "bytes": os.path.getsize(filename)}
+
+    @staticmethod
+    def write_vrt(outname: str, out) -> dict:
+        """Function to write the output to a .vrt file.
+
+        The lines are purged and written one by one, so that the corpus is never
+        held in memory as one string.
 
         [Args]:
-            out[list]: List containing the lines for the .vrt file as strings.
+            out[iterable]: List or generator containing the lines for the .vrt file as strings.
+
+        Returns:
+            dict: Number of tokens and bytes written.
         """
-        string = ""
-        for line in out:
-            string += line
-        string = OutObject.purge(string)
-        with open("{}.vrt".format(outname), "w") as file:
-            file.write(string)
-        print("+++ Finished writing {}.vrt +++".format(outname))
+        stats = OutObject.write_lines(
+            "{}.vrt".format(outname), OutObject.vrt_lines(out)
+        )
+        print(
+            "+++ Finished writing {}.vrt - {} tokens, {} bytes +++".format(
+                outname, stats["tokens"], stats["bytes"]
+            )
+        )
+        return stats
 
     @staticmethod
-    def write_xml(corpus_name: str, outname: str, out: list) -> None:
-        """CWB requires a semi-vrt xml including tab spaces."""
-        string = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
-        string += '<corpus name="{}">\n'.format(corpus_name)
-        string += "<text>\n"
+    def xml_lines(corpus_name: str, out, text: bool = True):
+        """Generator for the lines of the .xml file, including the corpus envelope.
+
+        The tokens are escaped one line at a time, structural attributes are passed on.
+
+        Args:
+                corpus_name[str]: Name of the corpus.
+                out[iterable]: Lines for the .xml file as strings.
+                text[bool]: Enclose the lines in <text>, set to False if the lines
+                    already contain the <text> structure."""
+        yield '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        yield '<corpus name="{}">\n'.format(corpus_name.translate(XML_ESCAPE))
+        if text:
+            yield "<text>\n"
         for line in out:
-            string += line
-        string += "</text>\n"
-        string += "</corpus>"
-        with open("{}.xml".format(outname), "w") as file:
-            file.write(string)
-        print("+++ Finished writing {}.xml +++".format(outname))
+            if OutObject.is_structural(line):
+                yield line
+            else:
+                yield line.translate(XML_ESCAPE)
+        if text:
+            yield "</text>\n"
+        yield "</corpus>"
+
+    @staticmethod
+    def write_xml(corpus_name: str, outname: str, out, text: bool = True) -> dict:
+        """CWB requires a semi-vrt xml including tab spaces.
+
+        The lines are escaped and written one by one, so that the corpus is never
+        held in memory as one string.
+
+        [Args]:
+            corpus_name[str]: Name of the corpus.
+            out[iterable]: List or generator containing the lines for the .xml file as strings.
+            text[bool]: Enclose the lines in <text>.
+
+        Returns:
+            dict: Number of tokens and bytes written.
+        """
+        stats = OutObject.write_lines(
+            "{}.xml".format(outname), OutObject.xml_lines(corpus_name, out, text)
+        )
+        print(
+            "+++ Finished writing {}.xml - {} tokens, {} bytes +++".format(
+                outname, stats["tokens"], stats["bytes"]
+            )
+        )
+        return stats
 
 
 # encode the generated files
@@ -326,10 +728,14 @@ class encode_corpus:
         return line
 
     # this needs refactor TODO
-    def setup(self) -> bool:
+    def setup(self, overwrite: bool = False) -> bool:
         """Funtion to check wheter a corpus directory exists. If existing directory is found,
-        requires input of "y" to overwrite existing files. Maybe add argument to force overwrite later?.
-        If directory is not found, an empty directory is created."""
+        requires input of "y" to overwrite existing files, unless overwrite is set.
+        If directory is not found, an empty directory is created.
+
+        Args:
+                overwrite[bool]: Overwrite an existing corpus without asking, ie when
+                    the corpus is encoded again from its annotated documents."""
 
         options = "[y/n]"
         # check if corpus directory exists
@@ -339,19 +745,17 @@ class encode_corpus:
             message = "Overwrite {} and {}?".format(
                 self.encodedir, self.regdir + self.corpusname
             )
-            purge = self.query(message, options)
+            purge = "y" if overwrite else self.query(message, options)
             # only overwrite if "y" to prevent accidental overwrite of data
             if purge == "y":
                 print("+++ Purging old corpus +++")
                 if os.path.isfile(self.regdir + self.corpusname):
-                    command = "rm {}".format(self.regdir + self.corpusname)
-                    print(command)
-                    os.system(command)
-                command = "rm -r {}".format(self.encodedir)
-                print(command)
-                os.system(command)
+                    print("Removing {}".format(self.regdir + self.corpusname))
+                    os.remove(self.regdir + self.corpusname)
+                print("Removing {}".format(self.encodedir))
+                shutil.rmtree(self.encodedir)
                 print("+++ Purged old corpus! +++")
-                os.system("mkdir {}".format(self.encodedir))
+                os.makedirs(self.encodedir)
                 return True
             # if no permission is granted we ask what to do
             else:
@@ -389,7 +793,7 @@ class encode_corpus:
 
         elif not os.path.isdir(self.encodedir):
             # if the directory doesn't exist we create one
-            os.system("mkdir {}".format(self.encodedir))
+            os.makedirs(self.encodedir)
             print("Created directory {}.".format(self.encodedir), flush=True)
             return True
 
@@ -411,125 +815,240 @@ class encode_corpus:
         # path = "/" + path
         return path
 
-    def encode_vrt(self, ptags, stags):
-        """Encode a new corpus into CWB from an existing vrt file."""
+    @staticmethod
+    def run_command(command: list, lines=None) -> dict:
+        """Function to run a cwb tool without a shell, optionally streaming lines to
+        its stdin while they are generated.
 
+        [Args]:
+                command[list]: The program and its arguments.
+                lines[iterable]: Lines as strings for stdin, None to not connect stdin.
+
+        Returns:
+                dict: The exit code, the run time in seconds and the number of
+                tokens and bytes written to stdin."""
+        print(" ".join(command))
+        stats = {"tokens": 0, "bytes": 0}
+        start = time.perf_counter()
+        if lines is None:
+            process = subprocess.Popen(command)
+        else:
+            process = subprocess.Popen(
+                command,
+                stdin=subprocess.PIPE,
+                encoding="utf-8",
+                bufsize=WRITE_BUFFER,
+            )
+            try:
+                for line in lines:
+                    if line.strip() and not OutObject.is_structural(line):
+                        stats["tokens"] += 1
+                    stats["bytes"] += len(line.encode("utf-8"))
+                    process.stdin.write(line)
+            except BrokenPipeError:
+                # the program stopped reading, its exit code tells why
+                pass
+            try:
+                process.stdin.close()
+            except BrokenPipeError:
+                pass
+        stats["returncode"] = process.wait()
+        stats["seconds"] = time.perf_counter() - start
+        print(
+            "{} finished with exit code {} after {:.1f} s".format(
+                command[0], stats["returncode"], stats["seconds"]
+            )
+        )
+        if stats["returncode"] != 0:
+            raise RuntimeError(
+                "Error: {} exited with code {}.".format(command[0], stats["returncode"])
+            )
+        return stats
+
+    def get_encode_command(self, ptags, stags, filename: str = None) -> list:
+        """Build the cwb-encode command, it reads from stdin if no file is given."""
         line = " "
         # find out which options are to be encoded
         line = self._get_s_attributes(line, stags)
         line = self._get_p_attributes(line, ptags)
+        command = ["cwb-encode", "-d", self.encodedir, "-xsBC9", "-c", "utf8"]
+        if filename is not None:
+            command += ["-f", filename]
+        command += ["-R", self.regdir + self.corpusname]
+        return command + line.split()
+
+    def make_registry(self) -> dict:
+        """Update the registry entry of the corpus with cwb-makeall."""
+        print("Updating the registry entry...")
+        return self.run_command(
+            ["cwb-makeall", "-r", self.regdir, "-V", self.corpusname]
+        )
+
+    def encode_vrt(self, ptags, stags):
+        """Encode a new corpus into CWB from an existing vrt file."""
+
         purged = self.setup()
         if purged:
-            # call the os with the encode command
             print("Encoding the corpus...")
             print("Options are:")
-            command = (
-                "cwb-encode -d "
-                + self.encodedir
-                + " -xsBC9 -c utf8 -f "
-                + self.outname
-                + ".vrt -R "
-                + self.regdir
-                + self.corpusname
-                + line
+            stats = self.run_command(
+                self.get_encode_command(ptags, stags, self.outname + ".vrt")
             )
-            print(command)
-            os.system(command)
-            print("Updating the registry entry...")
+            self.make_registry()
+            return stats
+        elif not purged:
+            return print(OSError("Error during setup, aborting..."))
+
+    def encode_lines(self, out, ptags, stags, style="STR", text=True, overwrite=False):
+        """Encode a new corpus into CWB by streaming the output lines to cwb-encode,
+        without writing the .vrt/.xml file first.
+
+        The lines are purged or escaped one at a time, so that annotation and
+        encoding overlap if out is a generator.
+
+        [Args]:
+                out[iterable]: Lines of the output as strings.
+                ptags[list]: The positional attributes of the output.
+                stags[list]: The structural attributes of the output.
+                style[str]: STR for .vrt style lines, else .xml.
+                text[bool]: Enclose the .xml lines in <text>.
+                overwrite[bool]: Overwrite an existing corpus without asking.
+
+        Returns:
+                dict: The exit code, run time, tokens and bytes of cwb-encode."""
+        purged = self.setup(overwrite)
+        if purged:
+            print("Encoding the corpus...")
             print("Options are:")
-            # call the os with the registry update command
-            command = "cwb-makeall -r " + self.regdir + " -V " + self.corpusname
-            print(command)
-            os.system(command)
+            if style == "STR":
+                lines = OutObject.vrt_lines(out)
+            else:
+                lines = OutObject.xml_lines(self.corpusname, out, text)
+            stats = self.run_command(self.get_encode_command(ptags, stags), lines)
+            self.make_registry()
+            return stats
         elif not purged:
             return print(OSError("Error during setup, aborting..."))
 
-    # this needs refactor TODO
+    @staticmethod
+    def drop_words(lines):
+        """Generator to remove the word column from the token lines, as the words
+        are already encoded in the corpus.
+
+        [Args]:
+                lines[iterable]: Lines of the .vrt output as strings."""
+        for line in lines:
+            if OutObject.is_structural(line) or not line.strip():
+                yield line
+            else:
+                # a token without annotations gives an empty line
+                yield line.split("\t", 1)[1] if "\t" in line else "\n"
+
     @classmethod
-    def add_tags_to_corpus(cls, mydict: dict, ptags: list, stags: list):
+    def add_tags_to_corpus(cls, mydict: dict, ptags: list, stags: list, out=None):
         """Function to add tags to an already existing corpus. Should be used with output based on
         pretokenized text decoded from said corpus to assure correct alignment.
 
+        The lines are streamed to cwb-encode one at a time, either from out or from
+        the .vrt output file, so that the corpus is never held in memory.
+
         [Args]:
                 mydict[dict]: Dictionary containing the encoding information.
                 ptags[list]: List containing the ptags to be used. These are checked against ptags
                             already present in the CWB corpus registry file.
                 stags[list]: List containing the stags present in the corpus.
-                            Only checked for the <s>...</s> structural attribute."""
-
-        # edit the vrt file to remove the words, this could maybe be done
-        # before the vrt is even written in the first place if we know
-        # that we want to add to an existing corpus
-
-        # not really happy with how this is handled right now
-        #########################################################
-
-        new = ""
-        with open(cls.outname + ".vrt", "r") as vrt:
-            lines = vrt.readlines()
-            for line in lines:
-                if not line.startswith("<"):
-                    new += line.split("\t", 1)[1]
-                else:
-                    new += line
-
-        with open(cls.outname + ".vrt", "w") as vrt:
-            vrt.write(new)
-
-        ##########################################################
+                            Only checked for the <s>...</s> structural attribute.
+                out[iterable]: Lines of the output, None to read the .vrt file.
 
+        Returns:
+                dict: The exit code, run time, tokens and bytes of cwb-encode and the
+                added ptags and stags."""
+        self = cls(mydict)
         # check which attributes are already present in the corpus
-        with open(cls.regdir + cls.corpusname, "r+") as registry:
-            attributes = []
-            structures = []
-            for line in registry:
-                if line.startswith("ATTRIBUTE"):
-                    attributes.append(line.split()[1])
-                if line.startswith("STRUCTURE"):
-                    structures.append(line.split()[1])
-
-            # if ptags are already present we change them to ptag_tool, if this is also
-            # already present we throw an error as the annotation does already exist
-            for i, ptag in enumerate(ptags):
-                if ptag in attributes:
-                    print("Renaming {} to {}".format(ptag, ptag + "_" + cls.tool))
-                    ptags[i] = ptag + "_" + cls.tool
-                    if ptags[i] in attributes:
-                        raise RuntimeError(
-                            "Ptag {} does already exist for this tool.".format(ptag)
-                        )
-
-            # remove existing structural tags
-            for stag in stags:
-                if stag in structures:
-                    stags.remove(stag)
+        registry_file = CorpusRegistry.read(self.regdir + self.corpusname)
+        tool = self.tool if isinstance(self.tool, str) else self.tool[-1]
+        ptags = registry_file.get_new_attributes(ptags or [], tool)
+        # remove existing structural tags
+        stags = [stag for stag in stags or [] if stag not in registry_file.structures]
+        # build the command for encoding
+        line = " "
+        for ptag in ptags:
+            line += "-P {} ".format(ptag)
+        line = self._get_s_attributes(line, stags)
+        # the "-p -" removes the inbuilt "word" attribute from the encoding process
+        command = ["cwb-encode", "-d", self.encodedir, "-xsBC9", "-c", "utf8"]
+        command += ["-p", "-"] + line.split()
+        if out is None:
+            lines = OutObject.read_lines(self.outname + ".vrt")
+        else:
+            lines = OutObject.vrt_lines(out)
+        stats = self.run_command(command, self.drop_words(lines))
+        # update the registry with the new attributes
+        print("Updating the registry entry...")
+        print("Adding ptags: {}".format(ptags))
+        registry_file.add(ptags, stags)
+        self.make_registry()
+        stats["ptags"] = ptags
+        stats["stags"] = stags
+        return stats
+
+
+class CorpusRegistry:
+    """The attributes of a corpus in its CWB registry file.
+
+    Args:
+        path[str]: Path to the registry file.
+        attributes[list]: Names of the positional attributes.
+        structures[list]: Names of the structural attributes."""
+
+    def __init__(self, path: str, attributes: list, structures: list) -> None:
+        self.path = path
+        self.attributes = attributes
+        self.structures = structures
 
-            # build the command for encoding
-            line = " "
-            for ptag in ptags:
-                line += "-P {} ".format(ptag)
-            line = cls._get_s_attributes(cls, line, stags)
-            # the "-p -" removes the inbuilt "word" attribute from the encoding process
-            command = (
-                "cwb-encode -d"
-                + cls.encodedir
-                + " -xsBC9 -c utf8 -f "
-                + cls.outname
-                + ".vrt -p - "
-                + line
-            )
-            print(command)
-            os.system(command)
+    @classmethod
+    def read(cls, path: str):
+        """Parse the registry file once into its attributes."""
+        attributes = []
+        structures = []
+        with open(path, "r", encoding="utf-8") as registry_file:
+            for line in registry_file:
+                fields = line.split()
+                if len(fields) < 2:
+                    continue
+                if fields[0] == "ATTRIBUTE":
+                    attributes.append(fields[1])
+                elif fields[0] == "STRUCTURE":
+                    structures.append(fields[1])
+        return cls(path, attributes, structures)
+
+    def get_new_attributes(self, ptags: list, tool: str) -> list:
+        """Rename the ptags that are already present in the corpus to ptag_tool.
+
+        Raises:
+                RuntimeError: If the renamed ptag is also present, as the annotation
+                    does already exist."""
+        new_ptags = []
+        for ptag in ptags:
+            if ptag in self.attributes:
+                print("Renaming {} to {}".format(ptag, ptag + "_" + tool))
+                if ptag + "_" + tool in self.attributes:
+                    raise RuntimeError(
+                        "Ptag {} does already exist for this tool.".format(ptag)
+                    )
+                ptag = ptag + "_" + tool
+            new_ptags.append(ptag)
+        return new_ptags
 
-            # update the registry with the new attributes
-            print("Updating the registry entry...")
-            registry.seek(0, 2)
-            print("Adding ptags:")
+    def add(self, ptags: list, stags: list) -> None:
+        """Append the new attributes to the registry file."""
+        with open(self.path, "a", encoding="utf-8") as registry_file:
             for ptag in ptags:
-                print(ptag)
-                registry.write("ATTRIBUTE {}\n".format(ptag))
+                registry_file.write("ATTRIBUTE {}\n".format(ptag))
             for stag in stags:
-                registry.write("STRUCTURE {}\n".format(stag))
+                registry_file.write("STRUCTURE {}\n".format(stag))
+        self.attributes.extend(ptags)
+        self.structures.extend(stags)
 
 
 # this needs refactor TODO
@@ -539,6 +1058,48 @@ class decode_corpus(encode_corpus):
     def __init__(self, mydict) -> None:
         super().__init__(mydict)
 
+    def decode_lines(self, p_attributes: list = None, s_attributes: list = None):
+        """Generator for the lines of the corpus in .vrt format, read from the
+        output of cwb-decode while it runs, so that no file is written.
+
+        [Args]:
+                p_attributes[list]: The positional attributes to decode.
+                s_attributes[list]: The structural attributes to decode,
+                    all attributes are decoded if neither are given.
+
+        Raises:
+                RuntimeError: If cwb-decode exits with an error."""
+        command = ["cwb-decode", "-C", "-r", self.regdir, self.corpusname]
+        if not p_attributes and not s_attributes:
+            command.append("-ALL")
+        for p_attribute in p_attributes or []:
+            command += ["-P", p_attribute]
+        for s_attribute in s_attributes or []:
+            command += ["-S", s_attribute]
+        print(" ".join(command))
+        process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, encoding="utf-8", bufsize=WRITE_BUFFER
+        )
+        try:
+            yield from process.stdout
+        finally:
+            # also stops cwb-decode if the lines are not read to the end
+            process.stdout.close()
+            process.wait()
+        if process.returncode != 0:
+            raise RuntimeError(
+                "Error: cwb-decode exited with code {}.".format(process.returncode)
+            )
+
+    def decode_sentences(self):
+        """Generator for the words of the corpus, one list of tokens per sentence."""
+        for sentence in tb.iter_sentences(self.decode_lines(["word"], ["s"])):
+            yield [row[0] for row in sentence]
+
+    def decode_table(self) -> tb.TokenTable:
+        """Decode the words and sentences of the corpus into a token table."""
+        return tb.TokenTable.from_lines(self.decode_lines(["word"], ["s"]))
+
     def decode_to_file(
         self,
         directory=os.getcwd(),
@@ -0,0 +1,233 @@
+# the persistent cache of annotations, so that unchanged text is not annotated again
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# change if the format of the cached annotations changes
+CACHE_VERSION = "1"
+# number of keys that are looked up in one query
+SQL_BATCH = 500
+
+
+class AnnotationCache:
+    """On-disk cache of annotations in a SQLite database.
+
+    The entries are addressed by a hash of the text and the tool configuration, so
+    that changing the text, model or processors gives a new entry. The values are
+    stored as json. If the cache exceeds its size, the least recently used entries
+    are dropped, entries older than the maximum age are dropped in any case.
+
+    Args:
+        path[str]: Path to the database file, created if it does not exist.
+        max_size[float]: Maximum size of the stored values in MB, None for no limit.
+        max_age[float]: Maximum time in days since an entry was last used,
+            None for no limit.
+    """
+
+    def __init__(self, path: str, max_size: float = None, max_age: float = None):
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        # access times of the entries that were read, written in batches
+        self.atimes = {}
+        self.lock = threading.Lock()
+        # the connection can not be used in forked processes
+        self.pid = os.getpid()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # several worker processes may share the database, wait for their writes
+        self.db = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS annotations "
+            "(key TEXT PRIMARY KEY, value TEXT, size INTEGER, atime REAL)"
+        )
+        self.db.commit()
+
+    @staticmethod
+    def get_key(*parts) -> str:
+        """Hash the text and the configuration into the key of an entry.
+
+        Args:
+                parts[str]: The parts of the key, ie tool configuration and text."""
+        myhash = hashlib.sha256(CACHE_VERSION.encode())
+        for part in parts:
+            myhash.update(b"\0")
+            myhash.update(part.encode("utf-8"))
+        return myhash.hexdigest()
+
+    def get(self, key: str):
+        """Get the value of an entry, None if it is not in the cache.
+
+        The access time of the entry is written with the next batch of updates."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM annotations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.atimes[key] = time.time()
+            if len(self.atimes) >= SQL_BATCH:
+                self._write_atimes()
+                self.db.commit()
+        return json.loads(row[0])
+
+    def _write_atimes(self) -> None:
+        """Write the access times of the read entries, call with the lock held."""
+        self.db.executemany(
+            "UPDATE annotations SET atime = ? WHERE key = ?",
+            [(atime, key) for key, atime in self.atimes.items()],
+        )
+        self.atimes = {}
+
+    def get_many(self, keys: list) -> list:
+        """Get the values of several entries, None for those not in the cache."""
+        found = {}
+        with self.lock:
+            for i in range(0, len(keys), SQL_BATCH):
+                batch = keys[i : i + SQL_BATCH]
+                found.update(
+                    self.db.execute(
+                        "SELECT key, value FROM annotations WHERE key IN ({})".format(
+                            ", ".join("?" * len(batch))
+                        ),
+                        batch,
+                    ).fetchall()
+                )
+            now = time.time()
+            self.atimes.update((key, now) for key in found)
+            self._write_atimes()
+            self.db.commit()
+            self.hits += sum(1 for key in keys if key in found)
+            self.misses += sum(1 for key in keys if key not in found)
+        return [json.loads(found[key]) if key in found else None for key in keys]
+
+    def put(self, key: str, value) -> None:
+        """Store a value that can be converted to json."""
+        value = json.dumps(value)
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            self._write_atimes()
+            self.db.commit()
+
+    def put_many(self, items: list) -> None:
+        """Store several (key, value) pairs in one transaction."""
+        rows = [
+            (key, value, len(value), time.time())
+            for key, value in ((key, json.dumps(value)) for key, value in items)
+        ]
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO annotations VALUES (?, ?, ?, ?)", rows
+            )
+            self._write_atimes()
+            self.db.commit()
+
+    @property
+    def size(self) -> float:
+        """Size of the stored values in MB."""
+        with self.lock:
+            return self._get_size() / 1024**2
+
+    def _get_size(self) -> int:
+        """Size of the stored values in bytes, call with the lock held."""
+        size = self.db.execute("SELECT SUM(size) FROM annotations").fetchone()[0]
+        return size or 0
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM annotations").fetchone()[0]
+
+    def evict(self) -> int:
+        """Drop the entries that are too old and the least recently used entries
+        until the cache is within its size.
+
+        Returns:
+                int: Number of dropped entries."""
+        dropped = 0
+        with self.lock:
+            # the least recently used entries are found by their access time
+            self._write_atimes()
+            if self.max_age is not None:
+                limit = time.time() - self.max_age * 24 * 3600
+                dropped += self.db.execute(
+                    "DELETE FROM annotations WHERE atime < ?", (limit,)
+                ).rowcount
+            if self.max_size is not None:
+                excess = self._get_size() - self.max_size * 1024**2
+                if excess > 0:
+                    keys = []
+                    for key, entry_size in self.db.execute(
+                        "SELECT key, size FROM annotations ORDER BY atime"
+                    ):
+                        if excess <= 0:
+                            break
+                        keys.append((key,))
+                        excess -= entry_size
+                    self.db.executemany("DELETE FROM annotations WHERE key = ?", keys)
+                    dropped += len(keys)
+            self.db.commit()
+        return dropped
+
+    def add_counts(self, hits: int, misses: int) -> None:
+        """Add the hits and misses of the cache in a worker process."""
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+
+    def stats(self) -> dict:
+        """Hits and misses of this process and the entries in the cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self),
+            "size": self.size,
+        }
+
+    def print_stats(self) -> None:
+        print(
+            "Annotation cache: {hits} hits, {misses} misses, "
+            "{entries} entries, {size:.1f} MB".format(**self.stats())
+        )
+
+    def close(self) -> None:
+        with self.lock:
+            self._write_atimes()
+            self.db.commit()
+            self.db.close()
+
+
+# the open caches of the process, one for each database file
+caches = {}
+caches_lock = threading.Lock()
+
+
+def get_cache(mydict: dict):
+    """Get the cache of the process that is set in the advanced options.
+
+    Args:
+            mydict[dict]: The input dict.
+
+    Returns:
+            AnnotationCache: The cache, None if no cache is set."""
+    options = mydict["advanced_options"]
+    path = options.get("cache")
+    if not path:
+        return None
+    with caches_lock:
+        if path not in caches or caches[path].pid != os.getpid():
+            caches[path] = AnnotationCache(
+                path,
+                max_size=options.get("cache_max_size"),
+                max_age=options.get("cache_max_age"),
+            )
+        return caches[path]
@@ -0,0 +1,208 @@
+# the annotation daemon keeps the pipelines loaded and accepts jobs
+import argparse
+import json
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import nlpannotator.base as be
+import nlpannotator.main as mn
+
+# text that is annotated once at startup so that all models are loaded
+WARM_UP_TEXT = "This is a sentence."
+
+
+class Annotator:
+    """Keeps the activated input dicts and runs the jobs one at a time,
+    the pipelines stay loaded in the model pool.
+
+    Args:
+        paths_json[list]: Paths to the input .json files. The configurations are
+            named after the file name without extension.
+    """
+
+    def __init__(self, paths_json: list):
+        self.configs = {}
+        for path in paths_json:
+            name = os.path.splitext(os.path.basename(path))[0]
+            self.configs[name] = mn.get_config(path)
+        # make sure the pool is large enough to keep all pipelines
+        ntools = sum(len(set(mydict["tool"])) for mydict in self.configs.values())
+        be.model_pool.configure(max_models=max(be.model_pool.max_models, ntools))
+        # the pipelines are not thread-safe
+        self.lock = threading.Lock()
+        self.jobs = 0
+
+    def warm_up(self) -> None:
+        """Load the pipelines of all configurations."""
+        for name in self.configs:
+            print("Warming up configuration {}.".format(name))
+            self.annotate(name, WARM_UP_TEXT)
+
+    def get_name(self, name: str = None) -> str:
+        """Find the configuration for a job, may be omitted if there is only one."""
+        if name is None and len(self.configs) == 1:
+            name = list(self.configs)[0]
+        if name not in self.configs:
+            raise KeyError(
+                "Configuration {} not found, available are {}.".format(
+                    name, list(self.configs)
+                )
+            )
+        return name
+
+    def annotate(self, name: str, text: str, outname: str = None) -> dict:
+        """Annotate a text with a configuration.
+
+        Args:
+                name[str]: Name of the configuration.
+                text[str]: The text to be annotated.
+                outname[str]: If given, write to the output_dir under this name instead
+                    of returning the output. Must be a file name without directory.
+
+        Returns:
+                dict: The output as string or the output file, and the runtime."""
+        if outname is not None and (
+            os.path.basename(outname) != outname or outname in ("", ".", "..")
+        ):
+            raise ValueError("Invalid outname {}, give a file name.".format(outname))
+        name = self.get_name(name)
+        mydict = self.configs[name]
+        data = be.PrepareRun.split_chunks(
+            text.splitlines(),
+            mydict["advanced_options"].get("chunk_size", be.CHUNK_SIZE),
+            mydict["advanced_options"].get("chunk_paragraphs", False),
+        )
+        start = time.perf_counter()
+        with self.lock:
+            out, _, _ = mn.annotate(mydict, data)
+            self.jobs += 1
+        result = {"config": name, "output": None, "outfile": None}
+        if outname is not None:
+            result["outfile"] = mydict["advanced_options"]["output_dir"] + outname
+            result.update(mn.write_out(mydict, out, outname))
+        elif mn.get_style(mydict) == "STR":
+            result["output"] = "".join(be.OutObject.vrt_lines(out))
+        else:
+            result["output"] = "".join(
+                be.OutObject.xml_lines(mydict["corpus_name"], out)
+            )
+        result["seconds"] = time.perf_counter() - start
+        return result
+
+    def status(self) -> dict:
+        """Report the configurations and the model pool."""
+        return {
+            "configs": list(self.configs),
+            "jobs": self.jobs,
+            "models": len(be.model_pool.models),
+            "hits": be.model_pool.hits,
+            "misses": be.model_pool.misses,
+        }
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    """Local job API.
+
+    GET /status reports the daemon status.
+    POST /annotate takes a json body with "text" and optionally "config" and
+    "outname", and returns the annotated text or the written file as json."""
+
+    def do_GET(self):
+        if self.path == "/status":
+            self.send_json(200, self.server.annotator.status())
+        else:
+            self.send_json(404, {"error": "Unknown path {}.".format(self.path)})
+
+    def do_POST(self):
+        if self.path != "/annotate":
+            self.send_json(404, {"error": "Unknown path {}.".format(self.path)})
+            return
+        # browsers can send text/plain across origins without asking first
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip()
+        if content_type != "application/json":
+            self.send_json(415, {"error": "Content-Type must be application/json."})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            job = json.loads(self.rfile.read(length))
+            # other json values than an object are errors of the client
+            if not isinstance(job, dict):
+                raise ValueError("The job must be a json object.")
+            if not isinstance(job.get("text", ""), str):
+                raise ValueError("The text of the job must be a string.")
+            result = self.server.annotator.annotate(
+                job.get("config"), job["text"], job.get("outname")
+            )
+        except (KeyError, ValueError, RuntimeError) as error:
+            self.send_json(400, {"error": str(error)})
+            return
+        except Exception as error:
+            # report errors of the tools instead of dropping the connection
+            self.send_json(500, {"error": "{}: {}".format(type(error).__name__, error)})
+            return
+        self.send_json(200, result)
+
+    def send_json(self, code: int, content: dict) -> None:
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self) -> str:
+        # unix sockets do not have a client address
+        if isinstance(self.client_address, tuple):
+            return super().address_string()
+        return "local"
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Http server on a local unix socket."""
+
+    daemon_threads = True
+
+
+def get_server(annotator: Annotator, host="127.0.0.1", port=8040, socket=None):
+    """Set up the server on localhost or on a unix socket.
+
+    Args:
+            annotator[Annotator]: The annotator that runs the jobs.
+            host[str]: Host to bind to, should be local.
+            port[int]: Port to bind to, 0 picks a free port.
+            socket[str]: Path to a unix socket, replaces host and port."""
+    if socket is not None:
+        if os.path.exists(socket):
+            os.remove(socket)
+        server = UnixHTTPServer(socket, JobHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), JobHandler)
+    server.annotator = annotator
+    return server
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Keep the pipelines of the input dicts loaded and annotate texts on request."
+    )
+    parser.add_argument("configs", nargs="+", help="Input .json files.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8040)
+    parser.add_argument("--socket", default=None, help="Serve on a unix socket.")
+    args = parser.parse_args(args)
+    annotator = Annotator(args.configs)
+    annotator.warm_up()
+    server = get_server(annotator, args.host, args.port, args.socket)
+    print("+++ Annotation daemon listening on {} +++".format(server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,56 @@
+import collections
+import copy
+import functools
+import glob
+import hashlib
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
 import nlpannotator.base as be
+import nlpannotator.cache as ac
 import nlpannotator.pipe as pe
-import nlpannotator.mspacy as msp
-import nlpannotator.mstanza as msa
-import nlpannotator.msomajo as mso
-import nlpannotator.mtreetagger as mtt
-import nlpannotator.mflair as mf
+import nlpannotator.table as tb
+
+# the module of each tool, imported only when a pipeline uses the tool
+backends = {
+    "spacy": "nlpannotator.mspacy",
+    "stanza": "nlpannotator.mstanza",
+    "somajo": "nlpannotator.msomajo",
+    "treetagger": "nlpannotator.mtreetagger",
+    "flair": "nlpannotator.mflair",
+}
+# number of chunks of a text that are looked up in the cache and annotated together
+CACHE_BATCH = 32
+
+
+def get_backend(tool: str):
+    """Import the module of a tool on first use.
+
+    Args:
+            tool[str]: Name of the tool, ie spacy."""
+    return importlib.import_module(backends[tool])
 
 
 def call_spacy(mydict, data, islist=False, style="STR"):
     spacy_dict = mydict["spacy_dict"]
+    msp = get_backend("spacy")
     # load the pipeline
-    annotated = msp.MySpacy(spacy_dict)
+    annotated = be.model_pool.get("spacy", spacy_dict, msp.MySpacy)
+    # stream the data through nlp.pipe
+    batch_size = spacy_dict["config"].get("nlp.batch_size")
+    n_process = be.PrepareRun.get_processes(mydict, spacy_dict)
+    if spacy_dict["set_device"] in ["prefer_GPU", "require_GPU"]:
+        # the GPU cannot be shared between processes
+        n_process = 1
     # apply pipeline to data
-    # data is not a list of sentences and will generate one doc object
     if not islist:
-        annotated.apply_to(data)
-        doc = annotated.doc
-    else:
-        # data is a list of sentences and will generate a list of doc objects
-        doc = []
-        for sentence in data:
-            annotated.apply_to(sentence)
-            doc.append(annotated.doc)
+        # data is not a list of sentences and will generate one doc object per chunk
+        data = be.PrepareRun.as_chunks(data)
+    # else data is a list of sentences and will generate a list of doc objects
+    annotated.apply_to_list(data, batch_size=batch_size, n_process=n_process)
+    doc = annotated.doc
     # we should not need start ..?
     start = 0
     out_obj = msp.OutSpacy(doc, annotated.jobs, start=start, style=style)
@@ -30,21 +59,26 @@ def call_spacy(mydict, data, islist=False, style="STR"):
 
 def call_stanza(mydict, data, islist=False, style="STR"):
     stanza_dict = mydict["stanza_dict"]
+    msa = get_backend("stanza")
     if islist:
-        stanza_dict["tokenize_no_ssplit"] = True
-        # stanza needs tokenizer or tokenize_pretokenized=True
-        # we want to avoid the latter so set the tokenizer
-        # in some cases it could happen that tokenization differs from the tools
-        # but we will walk that path when we get there
-        stanza_dict["processors"] = "tokenize," + stanza_dict["processors"]
+        # the data was already tokenized by the first tool
+        # stanza takes the tokens as they are with tokenize_pretokenized=True,
+        # so that the neural tokenizer is skipped and the tokens are aligned 1:1
         # https://stanfordnlp.github.io/stanza/tokenize.html#start-with-pretokenized-text
-        # set two continuous newlines so that sentences are not
-        # split but we still use efficient capabilities
-        data = [sent + "\n\n" for sent in data]
+        stanza_dict["tokenize_pretokenized"] = True
+        if "tokenize" not in stanza_dict["processors"]:
+            stanza_dict["processors"] = "tokenize," + stanza_dict["processors"]
+        data = [be.PrepareRun.as_tokens(sentence) for sentence in data]
     # load the pipeline
-    annotated = msa.MyStanza(stanza_dict)
+    annotated = be.model_pool.get("stanza", stanza_dict, msa.MyStanza)
     # apply pipeline to data
-    annotated.apply_to(data)
+    if not islist:
+        # the chunks of the text are processed in bulk, one doc object per chunk
+        # the batches of the processors are filled across the chunks
+        annotated.apply_to_list(be.PrepareRun.as_chunks(data))
+    else:
+        # the list of token lists generates one doc object with one sentence per list
+        annotated.apply_to(data)
     doc = annotated.doc
     # we should not need start ..?
     start = 0
@@ -54,11 +88,14 @@ def call_stanza(mydict, data, islist=False, style="STR"):
 
 def call_somajo(mydict, data, islist=False, style="STR"):
     somajo_dict = mydict["somajo_dict"]
+    mso = get_backend("somajo")
     # load the pipeline
     # somajo does only sentence-split and tokenization
-    tokenized = mso.MySomajo(somajo_dict)
+    tokenized = be.model_pool.get("somajo", somajo_dict, mso.MySomajo)
     # apply pipeline to data
-    tokenized.apply_to(data)
+    # somajo takes the chunks as paragraphs and tokenizes them in parallel
+    n_process = be.PrepareRun.get_processes(mydict, somajo_dict)
+    tokenized.apply_to(data, parallel=n_process)
     # we should not need start ..?
     start = 0
     # for somajo we never have list data as this will be only used for sentencizing
@@ -68,10 +105,15 @@ def call_somajo(mydict, data, islist=False, style="STR"):
 
 def call_treetagger(mydict, data, islist=True, style="STR"):
     treetagger_dict = mydict["treetagger_dict"]
+    mtt = get_backend("treetagger")
+    # the sentences are tagged in parallel by a poll of treetagger processes
+    treetagger_dict["n_process"] = be.PrepareRun.get_processes(mydict, treetagger_dict)
     # load the pipeline
     # treetagger does only tokenization for some languages and pos, lemma
-    annotated = mtt.MyTreetagger(treetagger_dict)
+    annotated = be.model_pool.get("treetagger", treetagger_dict, mtt.MyTreetagger)
     # apply pipeline to data
+    # the sentences are given as tokens, treetagger takes them as they are if
+    # it does not tokenize
     annotated.apply_to(data)
     # we should not need start ..?
     start = 0
@@ -82,15 +124,18 @@ def call_treetagger(mydict, data, islist=True, style="STR"):
 
 def call_flair(mydict, data, islist=True, style="STR"):
     flair_dict = mydict["flair_dict"]
+    mf = get_backend("flair")
     # load the pipeline
     # flair does only pos and ner
-    annotated = mf.MyFlair(flair_dict)
+    annotated = be.model_pool.get("flair", flair_dict, mf.MyFlair)
     # apply pipeline to data
-    # here we need to apply to each sentence one by one
-    doc = []
-    for sentence in data:
-        annotated.apply_to(sentence)
-        doc.append(annotated.doc)
+    if not islist:
+        data = be.PrepareRun.as_chunks(data)
+    # all sentences are predicted together in mini-batches
+    # the flair sentence takes a list of tokens as it is
+    mini_batch_size = flair_dict.get("mini_batch_size", mf.MINI_BATCH_SIZE)
+    annotated.apply_to_list(data, mini_batch_size=mini_batch_size)
+    doc = annotated.doc
     # we should not need start ..?
     start = 0
     print(annotated.jobs)
@@ -108,26 +153,190 @@ call_tool = {
 }
 
 
-def run(path_json, path_txt):
+def get_config(path_json) -> dict:
+    """Load, validate and activate the input dict.
+
+    Args:
+            path_json[str]: Path to the input .json file."""
     # load input dict
     mydict = be.PrepareRun.load_input_dict(path_json)
-    # get the data to be processed
-    data = be.PrepareRun.get_text(path_txt)
     # validate the input dict
     be.PrepareRun.validate_input_dict(mydict)
     # activate the input dict
     pe.SetConfig(mydict)
-    # now we still need to add the order of steps - processors was ordered list
-    # need to access that and tools to call tools one by one
-    data_islist = False
-    ptags = None
-    stags = None
+    # set the budget of the model pool - pipelines are reused between runs
+    be.model_pool.configure(
+        mydict["advanced_options"].get("max_models"),
+        mydict["advanced_options"].get("max_memory"),
+    )
+    return mydict
+
+
+def get_style(mydict) -> str:
+    """Get the output style from the output format."""
     if mydict["advanced_options"]["output_format"] == "vrt":
         style = "STR"
     elif mydict["advanced_options"]["output_format"] == "xml":
         style = "DICT"
     else:
         raise ValueError("Specified output format not recognized!")
+    return style
+
+
+def get_tool_key(mydict, mytool) -> str:
+    """The configuration of a tool that determines its annotations."""
+    return "{}:{}".format(
+        be.model_pool.get_key(mytool, mydict["{}_dict".format(mytool)]),
+        mydict["tool"].count(mytool),
+    )
+
+
+def assemble_sent(mydict, mytool, my_out_obj) -> tb.TokenTable:
+    """Assemble the output of the first tool into the token table."""
+    # do the sentence-level processing
+    # assemble sentences and tokens - this is independent of tool
+    out = my_out_obj.assemble_output_sent()
+    # further annotation: done with same tool?
+    if mydict["tool"].count(mytool) > 2:
+        print("Further annotation with tool {} ...".format(mytool))
+        out = my_out_obj.assemble_output_tokens(out)
+    return out
+
+
+def annotate_sent(mydict, mytool, data, style):
+    """Run the first tool, that sentencizes and tokenizes the data.
+
+    Returns:
+            tuple: The token table and the stags."""
+    my_out_obj = call_tool[mytool](mydict, data, False, style)
+    return assemble_sent(mydict, mytool, my_out_obj), my_out_obj.stags
+
+
+def annotate_chunks(mydict, mytool, chunks, style):
+    """Run the first tool on several chunks of text in one call and split the
+    output by chunk.
+
+    Returns:
+            tuple: A token table for each chunk and the stags."""
+    my_out_obj = call_tool[mytool](mydict, chunks, False, style)
+    counts = my_out_obj.sentence_counts()
+    if counts is None or len(counts) != len(chunks):
+        # the output of the chunks can not be told apart, run the tool on each
+        parts = [annotate_sent(mydict, mytool, [chunk], style) for chunk in chunks]
+        return [part for part, _ in parts], my_out_obj.stags
+    out = assemble_sent(mydict, mytool, my_out_obj)
+    return out.split(counts), my_out_obj.stags
+
+
+def annotate_tokens(mydict, mytool, data, out, style):
+    """Run a tool on the tokenized sentences and add its tags to the table.
+
+    Returns:
+            tuple: The token table and the ptags."""
+    my_out_obj = call_tool[mytool](mydict, data, True, style)
+    # we need to keep a copy of token-list only for multi-step annotation
+    # so that not of and of  ADP are being compared
+    # or only compare to substring from beginning of string
+    out = my_out_obj.assemble_output_tokens(out)
+    return out, my_out_obj.ptags
+
+
+def annotate_sent_cached(cache, mydict, mytool, data, style):
+    """Take the output of the first tool for each chunk of the text from the cache
+    if the chunk was annotated with the same configuration before. The chunks are
+    read in batches of CACHE_BATCH, the tool runs once on the other chunks of a
+    batch."""
+    tool_key = get_tool_key(mydict, mytool)
+    chunks = iter(be.PrepareRun.as_chunks(data))
+    parts = []
+    stags = None
+    while True:
+        batch = list(itertools.islice(chunks, CACHE_BATCH))
+        if not batch:
+            break
+        keys = [cache.get_key(tool_key, chunk) for chunk in batch]
+        values = cache.get_many(keys)
+        tables = {}
+        missing = [i for i, value in enumerate(values) if value is None]
+        if missing:
+            new_tables, stags = annotate_chunks(
+                mydict, mytool, [batch[i] for i in missing], style
+            )
+            for i, table in zip(missing, new_tables):
+                tables[i] = table
+                values[i] = {"table": table.to_dict(), "stags": stags}
+            cache.put_many([(keys[i], values[i]) for i in missing])
+        for i, value in enumerate(values):
+            if i not in tables:
+                tables[i] = tb.TokenTable.from_dict(value["table"])
+            parts.append(tables[i])
+        stags = values[-1]["stags"]
+    if not parts:
+        return annotate_sent(mydict, mytool, [], style)
+    return tb.TokenTable.concat(parts), stags
+
+
+def annotate_tokens_cached(cache, mydict, mytool, data, out, style):
+    """Take the tags of the sentences that were annotated before from the cache,
+    the tool only runs on the other sentences."""
+    tool_key = get_tool_key(mydict, mytool)
+    keys = [cache.get_key(tool_key, *sentence) for sentence in data]
+    values = cache.get_many(keys)
+    missing = [i for i, value in enumerate(values) if value is None]
+    ptags = list(values[0]) if values and values[0] is not None else []
+    if missing:
+        part = tb.TokenTable()
+        for i in missing:
+            part.add_sentence(data[i])
+        part, ptags = annotate_tokens(
+            mydict, mytool, [data[i] for i in missing], part, style
+        )
+        columns = {ptag: part.column(ptag) for ptag in ptags}
+        for (start, end), i in zip(part.sentence_bounds(), missing):
+            values[i] = {ptag: columns[ptag][start:end] for ptag in ptags}
+        cache.put_many([(keys[i], values[i]) for i in missing])
+    # a column of the same name in the table is kept, the new one numbered
+    names = []
+    for ptag in ptags:
+        names.append(
+            out.add_column(ptag, [tag for value in values for tag in value[ptag]])
+        )
+    return out, names
+
+
+def get_token_tools(mydict) -> list:
+    """The tools that annotate the tokens, ie that have other processors than
+    sentencize and tokenize."""
+    return [
+        mytool
+        for proc, mytool in zip(mydict["processing_type"], mydict["tool"])
+        if proc not in ("sentencize", "tokenize")
+    ]
+
+
+def annotate(mydict, data, table=None):
+    """Run the tools of an activated input dict on the data.
+
+    If the annotation cache is set, sentences that were annotated with the same
+    configuration before are taken from the cache.
+
+    Args:
+            mydict[dict]: The input dict after SetConfig.
+            data[str or iterable]: Text as string or chunks of text.
+            table[TokenTable]: Sentencized and tokenized input instead of the data,
+                only the tools that annotate the tokens are run on it.
+
+    Returns:
+            tuple: The token table of the output, the ptags and the stags."""
+    # the tools may change their dicts, keep the activated input dict intact
+    mydict = copy.deepcopy(mydict)
+    cache = ac.get_cache(mydict)
+    # now we still need to add the order of steps - processors was ordered list
+    # need to access that and tools to call tools one by one
+    data_islist = False
+    ptags = None
+    stags = None
+    style = get_style(mydict)
     # we need ordered "set"
     tools = set()  # a temporary lookup set
     ordered_tools = [
@@ -135,50 +344,515 @@ def run(path_json, path_txt):
         for mytool in mydict["tool"]
         if mytool not in tools and tools.add(mytool) is None
     ]
+    if table is not None:
+        # the input is already sentencized and tokenized
+        out = table
+        data = table.sentence_tokens()
+        data_islist = True
+        # the annotations of the input are kept
+        ptags = list(table.columns) or None
+        stags = ["s"]
+        token_tools = get_token_tools(mydict)
+        ordered_tools = [mytool for mytool in ordered_tools if mytool in token_tools]
     for mytool in ordered_tools:
         # here we do the object generation
         # we do not want to call same tools multiple times
         # as that would re-run the nlp pipelines
         # call specific routines
-        my_out_obj = call_tool[mytool](mydict, data, data_islist, style)
         if not data_islist:
             # the first tool will sentencize
-            # all subsequent ones will use sentencized input
-            # so the new data is sentences from first tool
-            # however, this is now a list
-            data = my_out_obj.sentences
-            # do the sentence-level processing
-            # assemble sentences and tokens - this is independent of tool
-            out = my_out_obj.assemble_output_sent()
-            # further annotation: done with same tool?
-            if mydict["tool"].count(mytool) > 2:
-                print("Further annotation with tool {} ...".format(mytool))
-                out = my_out_obj.assemble_output_tokens(out)
+            if cache is not None:
+                out, stags = annotate_sent_cached(cache, mydict, mytool, data, style)
+            else:
+                out, stags = annotate_sent(mydict, mytool, data, style)
+            # all subsequent ones will use sentencized and tokenized input
+            # so the new data is the tokens of the sentences from first tool
+            # however, this is now a list of lists
+            data = out.sentence_tokens()
             data_islist = True
-            stags = my_out_obj.stags
         elif data_islist:
             # sentencized and tokenized data already processed
             # now token-level annotation
-            # we need to keep a copy of token-list only for multi-step annotation
-            # so that not of and of  ADP are being compared
-            # or only compare to substring from beginning of string
-            out = my_out_obj.assemble_output_tokens(out)
-            ptags_temp = my_out_obj.ptags
+            if cache is not None:
+                out, ptags_temp = annotate_tokens_cached(
+                    cache, mydict, mytool, data, out, style
+                )
+            else:
+                out, ptags_temp = annotate_tokens(mydict, mytool, data, out, style)
             if ptags is not None:
                 ptags += ptags_temp
             else:
                 ptags = ptags_temp
+    return out, ptags, stags
+
+
+def evict_cache(mydict) -> None:
+    """Drop the old entries from the annotation cache and report its use."""
+    cache = ac.get_cache(mydict)
+    if cache is not None:
+        cache.evict()
+        cache.print_stats()
 
-    outfile = mydict["advanced_options"]["output_dir"] + mydict["corpus_name"]
-    if style == "STR":
+
+def write_out(mydict, out, outname=None, text=True) -> dict:
+    """Write the output to .vrt or .xml, depending on the output format.
+
+    Args:
+            mydict[dict]: The input dict.
+            out[iterable]: The lines of the output.
+            outname[str]: Name of the output file, default is the corpus name.
+            text[bool]: Enclose the .xml output in <text>, set to False if the
+                lines already contain the <text> structure.
+
+    Returns:
+            dict: Number of tokens and bytes written."""
+    if outname is None:
+        outname = mydict["corpus_name"]
+    outfile = mydict["advanced_options"]["output_dir"] + outname
+    if get_style(mydict) == "STR":
         # write out to .vrt
-        be.OutObject.write_vrt(outfile, out)
-    elif style == "DICT":
+        stats = be.OutObject.write_vrt(outfile, out)
+    else:
         # write out to .xml
-        be.OutObject.write_xml(mydict["corpus_name"], outfile, out)
-    # we will skip the encoding for now and instead provide vrt/xml file for user to download
-    # encode_obj = be.encode_corpus(mydict)
-    # encode_obj.encode_vrt(ptags, stags)
+        stats = be.OutObject.write_xml(mydict["corpus_name"], outfile, out, text)
+    return stats
+
+
+def encode_out(mydict, out, ptags, stags, text=True, overwrite=False) -> dict:
+    """Stream the output into cwb-encode instead of writing the .vrt/.xml file.
+
+    Args:
+            mydict[dict]: The input dict.
+            out[iterable]: The lines of the output.
+            ptags[list]: The positional attributes of the output.
+            stags[list]: The structural attributes of the output.
+            text[bool]: Enclose the .xml output in <text>.
+            overwrite[bool]: Overwrite an existing corpus without asking.
+
+    Returns:
+            dict: The exit code, run time, tokens and bytes of cwb-encode."""
+    encode_obj = be.encode_corpus(mydict)
+    return encode_obj.encode_lines(
+        out, ptags, stags, get_style(mydict), text, overwrite
+    )
+
+
+def write_corpus(mydict, text_ids, results, overwrite=False) -> dict:
+    """Write the documents of a corpus each enclosed in <text id="...">, or stream
+    them into cwb-encode if encode is set in the advanced options.
+
+    Args:
+            mydict[dict]: The input dict.
+            text_ids[list]: The ids of the documents.
+            results[iterable]: The output, ptags and stags of each document.
+            overwrite[bool]: Overwrite an existing corpus without asking.
+
+    Returns:
+            dict: Number of tokens and bytes written."""
+    results = iter(results)
+    # the attributes of the first document set the options for cwb-encode
+    first = next(results)
+    outs = (out for out, _, _ in itertools.chain([first], results))
+    lines = be.OutObject.text_lines(zip(text_ids, outs))
+    if mydict["advanced_options"].get("encode", False):
+        # the documents are enclosed in <text id="...">
+        stags = list(first[2] or []) + ["text:0+id"]
+        return encode_out(mydict, lines, first[1], stags, False, overwrite)
+    return write_out(mydict, lines, text=False)
+
+
+def get_inputs(path_txt) -> list:
+    """Find the input files for a run.
+
+    Args:
+            path_txt[str]: Path to a file, a directory or a glob pattern.
+
+    Returns:
+            list: The input files in sorted order."""
+    if os.path.isfile(path_txt):
+        return [path_txt]
+    if os.path.isdir(path_txt):
+        paths = [
+            os.path.join(path_txt, name)
+            for name in os.listdir(path_txt)
+            if not name.startswith(".")
+        ]
+        paths = [path for path in paths if os.path.isfile(path)]
+    else:
+        paths = glob.glob(path_txt)
+    if not paths:
+        raise FileNotFoundError("No input files found for {}.".format(path_txt))
+    return sorted(paths)
+
+
+def get_data(mydict, path_txt):
+    """Read the text of a document in chunks as set in the input dict."""
+    return be.PrepareRun.get_chunks(
+        path_txt,
+        mydict["advanced_options"].get("chunk_size", be.CHUNK_SIZE),
+        mydict["advanced_options"].get("chunk_paragraphs", False),
+    )
+
+
+def read_vrt(path_vrt, columns=None) -> tb.TokenTable:
+    """Read the sentences and tokens of a .vrt or .xml file or a file with one token
+    per line.
+
+    Only the sentences are kept of the structural attributes of the file, other
+    structures such as <text id="..."> or <p> and the attributes of <s> are dropped.
+
+    Args:
+            path_vrt[str]: Path to the file.
+            columns[list]: Names of the annotation columns of the file, to keep them
+                in the output. If None, the annotations are dropped.
+
+    Returns:
+            TokenTable: The tokens and the kept columns.
+
+    Raises:
+            ValueError: If the file has more annotation columns than names."""
+    lines = be.OutObject.read_lines(path_vrt)
+    # the tokens of .xml output are escaped
+    escaped = path_vrt.endswith(".xml")
+    if columns is not None:
+        table = tb.TokenTable.from_lines(
+            lines, fill=be.NOT_DEF, names=columns, escaped=escaped
+        )
+        if len(table.columns) > len(columns):
+            # numbered columns are not valid p-attributes for cwb
+            raise ValueError(
+                "{} has {} annotation columns but input_columns names {}.".format(
+                    path_vrt, len(table.columns), len(columns)
+                )
+            )
+        return table
+    table = tb.TokenTable()
+    for sentence in tb.iter_sentences(lines, escaped):
+        table.add_sentence([row[0] for row in sentence])
+    return table
+
+
+def annotate_input(mydict, path_txt) -> tuple:
+    """Annotate an input file in the input format set in the input dict.
+
+    Text is sentencized and tokenized by the first tool, pretokenized .vrt input is
+    only passed to the tools that annotate the tokens. The output of .vrt input is
+    structured by sentences only, see read_vrt.
+
+    Returns:
+            tuple: The token table of the output, the ptags and the stags."""
+    options = mydict["advanced_options"]
+    if options.get("input_format", "txt") == "vrt":
+        # add the new layers to the columns of the input if these are named
+        table = read_vrt(path_txt, options.get("input_columns"))
+        return annotate(mydict, None, table=table)
+    # the first tool reads the text chunk by chunk
+    return annotate(mydict, get_data(mydict, path_txt))
+
+
+def get_text_id(path_txt, root: str = None) -> str:
+    """The id of a document in the corpus is its path relative to the root of the
+    input without extension, the file name if no root is given."""
+    if root is None:
+        root = os.path.dirname(os.path.abspath(path_txt))
+    path = os.path.relpath(os.path.abspath(path_txt), root)
+    return os.path.splitext(path)[0].replace(os.sep, "/")
+
+
+def get_text_ids(paths) -> list:
+    """The ids of the documents of a corpus, relative to their common directory.
+
+    Raises:
+            ValueError: If two documents have the same id, ie doc.txt and doc.vrt."""
+    root = os.path.commonpath(
+        [os.path.dirname(os.path.abspath(path)) for path in paths]
+    )
+    text_ids = [get_text_id(path, root) for path in paths]
+    counts = collections.Counter(text_ids)
+    duplicates = sorted(text_id for text_id, count in counts.items() if count > 1)
+    if duplicates:
+        raise ValueError(
+            "Documents with the same id {} in the corpus, rename the files.".format(
+                duplicates
+            )
+        )
+    return text_ids
+
+
+def count_cache(func, job) -> tuple:
+    """Run a job in a worker process and count the hits and misses of the
+    annotation cache of the worker for it.
+
+    Args:
+            func[callable]: The function of the worker, ie annotate_file.
+            job[tuple]: The job, starting with the input dict.
+
+    Returns:
+            tuple: The result of the function and the hits and misses."""
+    cache = ac.get_cache(job[0])
+    if cache is None:
+        return func(job), (0, 0)
+    hits, misses = cache.hits, cache.misses
+    result = func(job)
+    return result, (cache.hits - hits, cache.misses - misses)
+
+
+def collect_cache_counts(mydict, results):
+    """Generator for the results of the worker processes, that adds the hits and
+    misses of their caches to the cache of this process."""
+    cache = ac.get_cache(mydict)
+    for result, (hits, misses) in results:
+        if cache is not None:
+            cache.add_counts(hits, misses)
+        yield result
+
+
+def annotate_file(job) -> tuple:
+    """Annotate one document of a corpus, also used by the worker processes.
+
+    Args:
+            job[tuple]: The input dict after SetConfig and the path to the document.
+
+    Returns:
+            tuple: The token table of the output, the ptags and the stags."""
+    mydict, path_txt = job
+    return annotate_input(mydict, path_txt)
+
+
+def run_corpus(mydict, paths) -> dict:
+    """Annotate several documents and write them to one output file, each
+    document enclosed in <text id="...">. The documents are distributed over a pool
+    of worker processes if multiprocessing is requested, the output keeps the order
+    of the documents.
+
+    Args:
+            mydict[dict]: The input dict after SetConfig.
+            paths[list]: Paths to the documents.
+
+    Returns:
+            dict: Number of tokens and bytes written."""
+    if mydict["advanced_options"].get("incremental", False):
+        return run_corpus_incremental(mydict, paths)
+    processes = min(be.PrepareRun.get_processes(mydict, {}), len(paths))
+    # the workers process one document each, the tools run in a single process
+    worker_dict = get_worker_dict(mydict)
+    jobs = [(worker_dict, path) for path in paths]
+    text_ids = get_text_ids(paths)
+    if processes > 1:
+        print("Annotating {} documents on {} processes.".format(len(paths), processes))
+        with multiprocessing.Pool(processes) as pool:
+            # write the documents as soon as they are ready, in order
+            results = pool.imap(functools.partial(count_cache, annotate_file), jobs)
+            results = collect_cache_counts(mydict, results)
+            stats = write_corpus(mydict, text_ids, results)
+    else:
+        results = map(annotate_file, jobs)
+        stats = write_corpus(mydict, text_ids, results)
+    evict_cache(mydict)
+    return stats
+
+
+def get_worker_dict(mydict) -> dict:
+    """The input dict for the workers, that annotate one document each and run
+    the tools in a single process."""
+    worker_dict = copy.deepcopy(mydict)
+    worker_dict["advanced_options"]["multiprocessing"] = False
+    # the workers of the pool are daemonic and can not start processes themselves
+    for mytool in backends:
+        if isinstance(worker_dict.get(mytool + "_dict"), dict):
+            worker_dict[mytool + "_dict"]["n_process"] = 1
+    return worker_dict
+
+
+def get_fragment_dir(mydict) -> str:
+    """The directory next to corpus_dir that keeps the manifest and the annotated
+    documents of the corpus for incremental updates."""
+    corpus_dir = os.path.normpath(mydict["advanced_options"]["corpus_dir"])
+    return "{}_{}_fragments/".format(corpus_dir, mydict["corpus_name"])
+
+
+def get_config_hash(mydict) -> str:
+    """Hash the options that determine the annotation, a change of these requires
+    to annotate all documents again."""
+    config = {key: value for key, value in mydict.items() if key != "advanced_options"}
+    config["chunk_size"] = mydict["advanced_options"].get("chunk_size", be.CHUNK_SIZE)
+    config["chunk_paragraphs"] = mydict["advanced_options"].get(
+        "chunk_paragraphs", False
+    )
+    config["input_format"] = mydict["advanced_options"].get("input_format", "txt")
+    config["input_columns"] = mydict["advanced_options"].get("input_columns")
+    config = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha256(config.encode("utf-8")).hexdigest()
+
+
+def get_file_hash(path_txt, config_hash: str) -> str:
+    """Hash the content of a document together with the configuration."""
+    myhash = hashlib.sha256(config_hash.encode("utf-8"))
+    with open(path_txt, "rb") as f:
+        for block in iter(lambda: f.read(be.WRITE_BUFFER), b""):
+            myhash.update(block)
+    return myhash.hexdigest()
+
+
+def load_manifest(path) -> dict:
+    """Load the manifest of an incremental corpus, empty if there is none yet."""
+    if not os.path.isfile(path):
+        return {"documents": {}, "ptags": None, "stags": None}
+    return be.PrepareRun.load_input_dict(path)
+
+
+def save_manifest(path, manifest: dict) -> None:
+    """Replace the manifest in one step, so that it is never written halfway."""
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def annotate_fragment(job) -> tuple:
+    """Annotate one document and write its lines to a fragment file, also used by
+    the worker processes.
+
+    Args:
+            job[tuple]: The input dict after SetConfig, the path to the document,
+                the fragment file and the id of the document.
+
+    Returns:
+            tuple: The ptags, the stags and the number of tokens and bytes written."""
+    mydict, path_txt, fragment, _ = job
+    out, ptags, stags = annotate_input(mydict, path_txt)
+    stats = be.OutObject.write_lines(fragment, out)
+    return ptags, stags, stats
+
+
+def run_corpus_incremental(mydict, paths) -> dict:
+    """Annotate only the documents of a corpus that are new or changed since the
+    last run and write the corpus from the annotated documents.
+
+    The content hash and the annotated lines of each document are kept in a
+    manifest and fragment files next to corpus_dir. Documents that are no longer
+    in the corpus are removed.
+
+    Args:
+            mydict[dict]: The input dict after SetConfig.
+            paths[list]: Paths to the documents.
+
+    Returns:
+            dict: Number of tokens and bytes written and of annotated and
+            unchanged documents."""
+    fragment_dir = get_fragment_dir(mydict)
+    os.makedirs(fragment_dir, exist_ok=True)
+    manifest_path = fragment_dir + "manifest.json"
+    manifest = load_manifest(manifest_path)
+    config_hash = get_config_hash(mydict)
+    worker_dict = get_worker_dict(mydict)
+    documents = {}
+    jobs = []
+    for path, text_id in zip(paths, get_text_ids(paths)):
+        fragment = fragment_dir + text_id + ".vrt"
+        # documents in subdirectories keep their directory
+        os.makedirs(os.path.dirname(fragment), exist_ok=True)
+        documents[text_id] = {"hash": get_file_hash(path, config_hash), "path": path}
+        old = manifest["documents"].get(text_id, {})
+        if old.get("hash") != documents[text_id]["hash"] or not os.path.isfile(
+            fragment
+        ):
+            jobs.append((worker_dict, path, fragment, text_id))
+        else:
+            documents[text_id]["tokens"] = old["tokens"]
+    print("Annotating {} new or changed of {} documents.".format(len(jobs), len(paths)))
+    processes = min(be.PrepareRun.get_processes(mydict, {}), len(jobs))
+    if processes > 1:
+        with multiprocessing.Pool(processes) as pool:
+            results = pool.map(functools.partial(count_cache, annotate_fragment), jobs)
+            results = list(collect_cache_counts(mydict, results))
+    else:
+        results = [annotate_fragment(job) for job in jobs]
+    for job, (ptags, stags, stats) in zip(jobs, results):
+        documents[job[3]]["tokens"] = stats["tokens"]
+        manifest["ptags"] = ptags
+        manifest["stags"] = stags
+    # drop the documents that were removed from the corpus
+    for text_id in set(manifest["documents"]) - set(documents):
+        if os.path.isfile(fragment_dir + text_id + ".vrt"):
+            os.remove(fragment_dir + text_id + ".vrt")
+    manifest["documents"] = documents
+    manifest["config"] = config_hash
+    save_manifest(manifest_path, manifest)
+    results = (
+        (
+            be.OutObject.read_lines(fragment_dir + text_id + ".vrt"),
+            manifest["ptags"],
+            manifest["stags"],
+        )
+        for text_id in documents
+    )
+    # the corpus is encoded again from all documents
+    stats = write_corpus(mydict, list(documents), results, overwrite=True)
+    stats["annotated"] = len(jobs)
+    stats["unchanged"] = len(paths) - len(jobs)
+    evict_cache(mydict)
+    return stats
+
+
+def read_corpus(mydict, corpus_name) -> tb.TokenTable:
+    """Decode the words and sentences of a CWB corpus into a token table, read
+    from cwb-decode while it runs.
+
+    Args:
+            mydict[dict]: The input dict with the corpus and registry directory.
+            corpus_name[str]: Name of the corpus in the registry."""
+    decode_obj = be.decode_corpus(mydict)
+    decode_obj.corpusname = corpus_name
+    return decode_obj.decode_table()
+
+
+def add_to_corpus(mydict, corpus_name, out, ptags, stags) -> dict:
+    """Stream the new layers of a re-annotated corpus into cwb-encode, the
+    attributes that the corpus already has are kept.
+
+    Args:
+            mydict[dict]: The input dict with the corpus and registry directory.
+            corpus_name[str]: Name of the corpus in the registry.
+            out[iterable]: The lines of the output, aligned with the corpus.
+            ptags[list]: The positional attributes of the output.
+            stags[list]: The structural attributes of the output.
+
+    Returns:
+            dict: The exit code, run time, tokens and bytes of cwb-encode and the
+                added ptags and stags."""
+    mydict = copy.deepcopy(mydict)
+    mydict["corpus_name"] = corpus_name
+    return be.encode_corpus.add_tags_to_corpus(mydict, ptags, stags, out)
+
+
+def write_or_encode(mydict, out, ptags, stags) -> dict:
+    """Write the output to the .vrt/.xml file or stream it into cwb-encode."""
+    if mydict["advanced_options"].get("encode", False):
+        return encode_out(mydict, out, ptags, stags)
+    # provide vrt/xml file for user to download
+    return write_out(mydict, out)
+
+
+def run(path_json, path_txt):
+    mydict = get_config(path_json)
+    if mydict["advanced_options"].get("input_format", "txt") == "cwb":
+        # re-annotate an existing corpus, path_txt is its name in the registry
+        out, ptags, stags = annotate(mydict, None, table=read_corpus(mydict, path_txt))
+        if mydict["advanced_options"].get("encode", False):
+            # add the new layers to the corpus instead of encoding it again
+            add_to_corpus(mydict, path_txt, out, ptags, stags)
+        else:
+            write_out(mydict, out)
+        evict_cache(mydict)
+        return
+    paths = get_inputs(path_txt)
+    if not os.path.isfile(path_txt):
+        # a directory or pattern is annotated as corpus of documents
+        run_corpus(mydict, paths)
+        return
+    out, ptags, stags = annotate_input(mydict, path_txt)
+    write_or_encode(mydict, out, ptags, stags)
+    evict_cache(mydict)
 
 
 if __name__ == "__main__":
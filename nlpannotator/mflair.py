@@ -2,6 +2,9 @@ from flair.data import Sentence
 from flair.models import SequenceTagger, MultiTagger
 import nlpannotator.base as be
 
+# default number of sentences that are predicted together
+MINI_BATCH_SIZE = 32
+
 
 class MyFlair:
     """Flair main processing class. Flair only does POS and NER tagging.
@@ -34,6 +37,24 @@ class MyFlair:
         self.nlp.predict(self.doc)
         return self
 
+    def apply_to_list(self, data: list, mini_batch_size: int = MINI_BATCH_SIZE):
+        """Function to apply pipeline to all sentences in mini-batches.
+
+        Flair sorts the sentences by length to fill the batches and keeps their
+        order in the doc. The embeddings are discarded after each batch, so that
+        the memory does not grow with the number of sentences.
+
+        Args:
+                data[list]: Sentences as strings or lists of tokens.
+                mini_batch_size[int]: Number of sentences predicted together."""
+
+        # Flair needs the input as sentence objects, lists of tokens are used as is
+        self.doc = [Sentence(sentence) for sentence in data]
+        self.nlp.predict(
+            self.doc, mini_batch_size=mini_batch_size, embedding_storage_mode="none"
+        )
+        return self
+
 
 class OutFlair(be.OutObject):
     """Out object for flair annotation, adds flair-specific methods to the
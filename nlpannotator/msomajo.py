@@ -1,5 +1,6 @@
 from somajo import SoMaJo
 import nlpannotator.base as be
+import nlpannotator.table as tb
 
 
 class MySomajo:
@@ -9,29 +10,39 @@ class MySomajo:
     [Args]:
            text[list[str] or str]: List of strings (paragraphs) or string.
            model[str]: Model to be used by somajo, options are de_CMC, en_PTB.
-           split_sentences[bool]: Perform sentence splitting in addition to tokenization."""
+           split_sentences[bool]: Perform sentence splitting in addition to tokenization.
+    """
 
     def __init__(self, subdict: dict) -> None:
         self.model = subdict["model"]
         self.jobs = subdict["processors"]
         self.sentencize = subdict["split_sentences"]
         self.camelcase = subdict["split_camel_case"]
+        # the tokenizer is built once and reused for all texts
+        self.nlp = SoMaJo(
+            self.model,
+            split_camel_case=self.camelcase,
+            split_sentences=self.sentencize,
+        )
+
+    def apply_to(self, text: list or str, parallel: int = 1):
+        """Apply pipeline to text.
 
-    def apply_to(self, text: list or str):
-        """Apply pipeline to text."""
+        The doc is a generator of the sentences, so that the tokens are passed on
+        lazily and can be consumed only once.
+
+        Args:
+                text[list[str] or str]: List of strings (paragraphs) or string.
+                parallel[int]: Number of processes to tokenize the paragraphs on."""
         # somajo takes list as input
         if type(text) == str:
             text = [text]
-
-        self.doc = list(
-            list(
-                SoMaJo(
-                    self.model,
-                    split_camel_case=self.camelcase,
-                    split_sentences=self.sentencize,
-                ).tokenize_text(text)
-            )
+        # the paragraphs of a chunk are kept apart by the paragraph separator
+        text = (
+            paragraph for chunk in text for paragraph in chunk.split(be.PARAGRAPH_SEP)
         )
+
+        self.doc = self.nlp.tokenize_text(text, parallel=parallel)
         return self
 
 
@@ -41,19 +52,23 @@ class OutSomajo(be.OutObject):
         self.attrnames = self.attrnames["somajo_names"]
         self.stags = self.get_stags()
 
-    def assemble_output_sent(self) -> list:
+    def sentence_counts(self) -> list:
+        """The sentences of all chunks are generated by one tokenizer run, these
+        can not be counted by chunk."""
+        return None
+
+    def assemble_output_sent(self):
         """Sentence assembly for somajo."""
 
         # if senter is called we insert sentence symbol <s> before and </s> after
         # every sentence
         # if only sentence is provided, directly call the methods
+        # the sentences are consumed one by one from the doc generator
 
         self.tstart = 0
-        out = []
+        out = tb.TokenTable()
         for sent in self.doc:
-            out.append("<s>\n")
             out = self.iterate(out, sent)
-            out.append("</s>\n")
         return out
 
     @property
@@ -74,6 +89,8 @@ class OutSomajo(be.OutObject):
             )
             exit()
 
+        # the doc generator can only be consumed once
+        self.doc = list(self.doc)
         sents = []
         for sent in self.doc:
             line = ""
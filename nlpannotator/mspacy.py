@@ -1,6 +1,9 @@
 import spacy as sp
 import nlpannotator.base as be
 
+# components that a rule-based lemmatizer needs to get the pos
+LEMMATIZER_REQUIRES = ["tagger", "morphologizer", "attribute_ruler"]
+
 
 class MySpacy:
     """Base class for spaCy module.
@@ -55,6 +58,34 @@ class MySpacy:
                 )
                 raise ValueError(message)
             print(">>>")
+        # only run what was requested
+        self._select_components()
+
+    def _select_components(self):
+        """Disable all components that were not requested, so that they are not run.
+        Shared tok2vec layers are kept if any requested component listens to them."""
+        keep = set(self.jobs)
+        if "parser" in keep:
+            # the parser sets the sentence boundaries, the senter that is disabled
+            # in the models would only repeat its work
+            keep.discard("senter")
+        for name, component in self.nlp.components:
+            if name in keep and getattr(component, "mode", None) == "rule":
+                # the rule-based lemmatizer uses the pos
+                keep.update(LEMMATIZER_REQUIRES)
+        for name, component in self.nlp.components:
+            # tok2vec and transformer keep track of the components listening to them
+            listeners = getattr(component, "listening_components", [])
+            if any(listener in keep for listener in listeners):
+                keep.add(name)
+        for name in self.nlp.component_names:
+            if name in keep and name in self.nlp.disabled:
+                self.nlp.enable_pipe(name)
+            elif name not in keep and name not in self.nlp.disabled:
+                self.nlp.disable_pipe(name)
+        # the components that are actually executed
+        self.executed = list(self.nlp.pipe_names)
+        print("Running components {} from {}.".format(self.executed, self.model))
 
     def _set_tok2vec(self):
         # if we ask for lemma and/or POS we force tok2vec to boost accuracy
@@ -85,10 +116,31 @@ class MySpacy:
     def apply_to(self, data: str):
         """Apply the objects pipeline to a given data string."""
 
-        # apply to data while disabling everything that wasnt requested
+        # apply to data - everything that wasn't requested is disabled
         self.doc = self.nlp(data)
         return self
 
+    def apply_to_list(self, data: list, batch_size: int = None, n_process: int = 1):
+        """Apply the objects pipeline to a list of texts in batches using nlp.pipe.
+        The order of the docs is the same as the order of the texts.
+
+        Args:
+                data[list]: List of strings, ie sentences or chunks of text, or
+                    lists of tokens for sentences that are already tokenized.
+                batch_size[int]: Number of texts per batch, default is nlp.batch_size.
+                n_process[int]: Number of processes to run the pipeline on."""
+
+        # pretokenized sentences are passed as doc objects to skip the tokenizer
+        data = (self._make_doc(text) for text in data)
+        self.doc = list(self.nlp.pipe(data, batch_size=batch_size, n_process=n_process))
+        return self
+
+    def _make_doc(self, text):
+        """Make a doc object from a list of tokens, strings are passed on."""
+        if type(text) == list:
+            return sp.tokens.Doc(self.nlp.vocab, words=text)
+        return text
+
 
 # inherit the output class from base and add spacy-specific methods
 class OutSpacy(be.OutObject):
@@ -100,6 +152,21 @@ class OutSpacy(be.OutObject):
         self.attrnames = self.attrnames["spacy_names"]
         self.stags = self.get_stags()
 
+    def iterate(self, out, sent):
+        """Add the tokens of a sentence to the table, whitespace tokens as for the
+        paragraph separator are left out and blank sentences are skipped."""
+        tokens = [token.text for token in sent if not token.is_space]
+        if tokens:
+            out.add_sentence(tokens)
+        return out
+
+    def sentence_counts(self) -> list:
+        """Number of sentences of each doc that are not blank, see iterate."""
+        return [
+            sum(1 for sent in doc.sents if not all(token.is_space for token in sent))
+            for doc in self.doc_list()
+        ]
+
     def assemble_output_tokens(self, out) -> list:
         """Assemlbe token and annotation data."""
         # check for list of docs -> list of sentences
@@ -137,9 +204,10 @@ class OutSpacy(be.OutObject):
                 "Seems there is no Doc object, did you forget to call MySpacy.apply_to()?"
             )
             exit()
-        assert self.doc.has_annotation("SENT_START")
 
         sents = []
-        for sent in self.doc.sents:
-            sents.append(sent.text)
+        for doc in self.doc_list():
+            assert doc.has_annotation("SENT_START")
+            for sent in doc.sents:
+                sents.append(sent.text)
         return sents
@@ -22,7 +22,37 @@ class MyStanza:
         else:
             self.jobs = self.subdict["processors"]
         # Initialize the pipeline
-        self.nlp = sa.Pipeline(**self.subdict)
+        self.nlp = sa.Pipeline(**self.get_options(self.subdict))
+
+    @staticmethod
+    def get_options(subdict: dict) -> dict:
+        """Flatten the processor dicts of the stanza dict into pipeline options.
+
+        The options in stanza_tokenize, stanza_pos, ... are only read by stanza if
+        they are passed to the pipeline directly, ie pos_batch_size. Options that are
+        not set (None) are left to the stanza defaults, options on the top level
+        take precedence.
+
+        Args:
+                subdict[dict]: The stanza input dictionary."""
+        options = {}
+        for key, value in subdict.items():
+            if key.startswith("stanza_") and type(value) == dict:
+                options.update(
+                    {
+                        name: option
+                        for name, option in value.items()
+                        if option is not None
+                    }
+                )
+        options.update(
+            {
+                key: value
+                for key, value in subdict.items()
+                if not (key.startswith("stanza_") and type(value) == dict)
+            }
+        )
+        return options
 
     def apply_to(self, text: str) -> dict:
         """Funtion to apply pipeline to provided textual data.
@@ -33,6 +63,19 @@ class MyStanza:
         self.doc = self.nlp(text)  # Run the pipeline on the input text
         return self
 
+    def apply_to_list(self, data: list):
+        """Function to apply pipeline to several texts in bulk.
+
+        The texts are wrapped into stanza Documents and processed together, so that
+        the batches of the processors (pos_batch_size, lemma_batch_size, ...) are
+        filled across the texts. Generates one doc object per text.
+
+        Args:
+                data[list]: Texts as strings, ie chunks or sentences."""
+        docs = [sa.Document([], text=text) for text in data]
+        self.doc = self.nlp(docs)
+        return self
+
 
 # to be integrated in collect results - TODO
 def ner(doc) -> dict:
@@ -62,18 +105,19 @@ class OutStanza(be.OutObject):
 
     # add new method for stanza iteration over tokens/words/ents
     # TODO: set MWT correctly - iterate over tokens or words?
-    def iterate(self, out: list, sent) -> list:
-        """Function to iterate through sentence object and extract data to list.
+    def iterate(self, out, sent):
+        """Function to iterate through sentence object and add the tokens to the table.
 
         Args:
-                out[list]: List containing the collected output.
+                out[TokenTable]: Table containing the collected output.
                 sent[stanza sent-Object]: Object containing tokenized sentence."""
 
-        for token, word in zip(getattr(sent, "tokens"), getattr(sent, "words")):
-            if token.text != word.text:
+        tokens = []
+        for token in getattr(sent, "tokens"):
+            if len(token.words) > 1:
                 print(
-                    "Found MWT - please check if annotated correctly!!! Token {} != word {}.".format(
-                        token.text, word.text
+                    "Found MWT - please check if annotated correctly!!! Token {} != words {}.".format(
+                        token.text, [word.text for word in token.words]
                     )
                 )
                 print("Because I am not sure how CWB handles these s-attributes.")
@@ -81,8 +125,8 @@ class OutStanza(be.OutObject):
                 # "Multi-word expressions not available currently"
                 # )
             tid = token.id[0] + self.tstart
-            line = token.text
-            out.append(line + "\n")
+            tokens.append(token.text)
+        out.add_sentence(tokens)
         self.tstart = tid
         return out
 
@@ -90,41 +134,13 @@ class OutStanza(be.OutObject):
         # for stanza we always have sentence level
         # as stanza allows feeding of sentences manually
         token_list = []
-        word_list = []
-        for sent in self.doc.sentences:
-            token_list += self.token_list(sent)
-            word_list += self.word_list(sent)
-        token_list_out = self.out_shortlist(out)
-        # now compare the tokens in out with the token objects from stanza
-        # here we need to check what to do with mwt - we may need word
-        # instead of token
-        for token_stanza, word_stanza, token_out in zip(
-            token_list, word_list, token_list_out
-        ):
-            mylen = len(token_stanza.text)
-            # print(
-            # "Checking for tokens {} {}".format(
-            # token_stanza.text, token_out[0][0:mylen]
-            # )
-            # )
-            # print(
-            # "Checking for words {} {}".format(
-            # word_stanza.text, token_out[0][0:mylen]
-            # )
-            # )
-            # check that the text is the same
-            # here we may need to check for word..?
-            if token_stanza.text != token_out[0][0:mylen]:
-                print(
-                    "Found different token than in out! - {} and {}".format(
-                        token_stanza.text, token_out[0][0:mylen]
-                    )
-                )
-                print("Please check your inputs!")
-            else:
-                line = self.collect_results(token_stanza, 0, word_stanza)
-                # now add the annotation
-                out[token_out[1]] = out[token_out[1]].replace("\n", "") + line + "\n"
+        for doc in self.doc_list():
+            for sent in doc.sentences:
+                token_list += self.token_list(sent)
+        # multi-word tokens are annotated with the tags of their first word,
+        # the other tokens consist of exactly one word
+        word_list = [token.words[0] for token in token_list]
+        out = self.iterate_tokens(out, token_list, word_list)
         return out
 
     def token_list(self, myobj: list) -> list:
@@ -152,6 +168,7 @@ class OutStanza(be.OutObject):
             exit()
 
         sents = []
-        for sent in self.doc.sentences:
-            sents.append(sent.text)
+        for doc in self.doc_list():
+            for sent in doc.sentences:
+                sents.append(sent.text)
         return sents
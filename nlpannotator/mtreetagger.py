@@ -1,6 +1,10 @@
+from collections import namedtuple
 import treetaggerwrapper as ttw
 import nlpannotator.base as be
 
+# compact record for the tagged tokens
+TreetaggerToken = namedtuple("TreetaggerToken", ["text", "pos", "lemma"])
+
 
 class MyTreetagger:
     """Treetagger main processing class.
@@ -18,48 +22,102 @@ class MyTreetagger:
         # set tagonly if already tokenized
         if "tokenize" not in self.jobs:
             self.subdict["tagonly"] = True
+        self.tagonly = self.subdict.get("tagonly", False)
+        self.n_process = self.subdict.get("n_process", 1)
         # Initialize the pipeline
-        self.nlp = ttw.TreeTagger(
-            TAGLANG=self.subdict["lang"], TAGOPT=self.subdict["tagopt"]
-        )
+        if self.n_process > 1:
+            # a poll of persistent treetagger processes that tag shards in parallel
+            self.nlp = ttw.TaggerPoll(
+                workerscount=self.n_process,
+                taggerscount=self.n_process,
+                TAGLANG=self.subdict["lang"],
+                TAGOPT=self.subdict["tagopt"],
+            )
+        else:
+            self.nlp = ttw.TreeTagger(
+                TAGLANG=self.subdict["lang"], TAGOPT=self.subdict["tagopt"]
+            )
 
-    def apply_to(self, text: str) -> object:
+    def apply_to(self, text) -> object:
         """Funtion to apply pipeline to provided textual data.
 
         Args:
-                text[str]: Textual Data as string."""
-
-        self.doc = self.nlp.tag_text(text)
-        # separate the tags and put in dict - use treetagger intrinsic
-        self.doc = self._make_dict()
-        # convert the dict to properties of token object
-        self._make_object()
-        return self
-
-    def _make_dict(self):
-        # separate the tags and put in dict
-        return [item._asdict() for item in ttw.make_tags(self.doc)]
-
-    def _make_object(self):
-        self.doc = [TreetaggerDoc(token) for token in self.doc]
+                text[str or list]: Textual Data as string or list of sentences, the
+                    sentences are lists of tokens if the text is already tokenized."""
+
+        shards = self.get_shards(text, self.n_process, self.tagonly)
+        if self.n_process > 1:
+            jobs = [
+                self.nlp.tag_text_async(shard, tagonly=self.tagonly) for shard in shards
+            ]
+            self.doc = []
+            for job in jobs:
+                job.wait_finished()
+                self.doc += job.result
+        else:
+            self.doc = self.nlp.tag_text(shards[0], tagonly=self.tagonly)
+        # separate the tags into compact token records - use treetagger intrinsic
+        self.doc = self._make_tokens()
         return self
 
+    def release(self) -> None:
+        """Stop the treetagger processes of the poll, called when the pipeline is
+        dropped from the model pool."""
+        if self.n_process > 1:
+            self.nlp.stop_poll()
 
-class TreetaggerDoc:
-    def __init__(self, outdict: dict):
-        self.outdict = outdict
-
-    @property
-    def text(self):
-        return self.outdict["word"]
+    @staticmethod
+    def get_shards(text, n_process: int = 1, tagonly: bool = False) -> list:
+        """Split the text into consecutive shards of whole sentences, one for each
+        process.
 
-    @property
-    def lemma(self):
-        return self.outdict["lemma"]
-
-    @property
-    def pos(self):
-        return self.outdict["pos"]
+        Args:
+                text[str or list]: Text as string or list of sentences.
+                n_process[int]: Number of processes that tag the shards.
+                tagonly[bool]: The text is tokenized, the shards are lists of tokens.
+
+        Returns:
+                list: The shards, strings can not be split and form one shard."""
+        if tagonly:
+            # treetagger takes one token per item
+            if type(text) == str:
+                text = [text.split()]
+            sentences = [be.PrepareRun.as_tokens(sentence) for sentence in text]
+            total = sum(len(sentence) for sentence in sentences)
+            n_shards = max(min(n_process, len(sentences)), 1)
+            shards = [[]]
+            count = 0
+            for sentence in sentences:
+                # cut where the shard is closest to an equal share of the tokens
+                bound = total * len(shards) / n_shards
+                if (
+                    shards[-1]
+                    and len(shards) < n_shards
+                    and count + len(sentence) - bound > bound - count
+                ):
+                    shards.append([])
+                shards[-1].extend(sentence)
+                count += len(sentence)
+            return shards
+        elif type(text) == str:
+            return [text]
+        text = [be.PrepareRun.as_text(sentence) for sentence in text]
+        size = max(-(-len(text) // max(n_process, 1)), 1)
+        shards = [text[i : i + size] for i in range(0, len(text), size)]
+        return shards if shards else [text]
+
+    def _make_tokens(self) -> list:
+        """Convert the tags to compact token records, tokens without tags that
+        treetagger replaced (ie urls) are undefined. Extra columns of the output,
+        ie the probabilities for tagopt -prob, are dropped."""
+        return [
+            (
+                TreetaggerToken(tag.word, tag.pos, tag.lemma)
+                if isinstance(tag, (ttw.Tag, ttw.TagExtra))
+                else TreetaggerToken(tag.what, be.NOT_DEF, be.NOT_DEF)
+            )
+            for tag in ttw.make_tags(self.doc, allow_extra=True)
+        ]
 
 
 class OutTreetagger(be.OutObject):
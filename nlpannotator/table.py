@@ -0,0 +1,240 @@
+# the columnar token table that collects the annotations of all tools
+import html
+import itertools
+import re
+from array import array
+
+# structural attributes and xml declaration in the input, ie <s>, </s>, <text id="1">
+STRUCT_TAG = re.compile(r"^<[/?]?[A-Za-z_][\w.\-]*(\s[^>]*)?>$")
+# the structural attributes and xml envelope that the output is written with, all
+# other lines of the output are tokens whatever their content
+OUT_STRUCTURE = re.compile(
+    r'^(</?s>|</?text>|<text id="[^"<>]*">|</corpus>|<corpus name="[^"<>]*">'
+    r"|<\?xml [^<>]*\?>)$"
+)
+
+
+class TokenTable:
+    """Columnar store of the tokens and their annotations.
+
+    The token texts are kept in one list together with the index of the sentence of
+    each token. Every annotation layer is an array of integer codes into the
+    vocabulary of its column, so that repeated tags are stored only once and adding
+    a layer does not touch the existing columns.
+    Iterating over the table gives the lines of the .vrt output."""
+
+    def __init__(self):
+        self.tokens = []
+        # index of the sentence for each token
+        self.sentence = array("l")
+        self.nsentences = 0
+        # the annotation layers in the order of the .vrt columns
+        self.columns = {}
+        self.vocabs = {}
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def __iter__(self):
+        return self.lines()
+
+    def add_sentence(self, tokens: list) -> None:
+        """Append the tokens of a sentence.
+
+        Args:
+                tokens[list]: Token texts of the sentence."""
+        if self.columns:
+            raise ValueError("Error: Cannot add sentences after adding columns.")
+        self.tokens.extend(tokens)
+        self.sentence.extend([self.nsentences] * len(tokens))
+        self.nsentences += 1
+
+    def get_name(self, name: str) -> str:
+        """Number the name of a column if a column of that name exists already."""
+        newname = name
+        i = 1
+        while newname in self.columns:
+            i += 1
+            newname = "{}_{}".format(name, i)
+        return newname
+
+    def add_column(self, name: str, values) -> str:
+        """Add an annotation layer with one value for each token.
+
+        Args:
+                name[str]: Name of the column, e.g. pos, lemma, ner.
+                values[iterable]: The tags in the order of the tokens.
+
+        Returns:
+                str: The name of the column, numbered if the name was taken."""
+        codes = {}
+        vocab = []
+        column = array("l")
+        for value in values:
+            code = codes.get(value)
+            if code is None:
+                code = len(vocab)
+                codes[value] = code
+                vocab.append(value)
+            column.append(code)
+        if len(column) != len(self.tokens):
+            raise ValueError(
+                "Error: Column {} has {} values for {} tokens.".format(
+                    name, len(column), len(self.tokens)
+                )
+            )
+        name = self.get_name(name)
+        self.columns[name] = column
+        self.vocabs[name] = vocab
+        return name
+
+    def column(self, name: str) -> list:
+        """Get the values of a column as strings."""
+        vocab = self.vocabs[name]
+        return [vocab[code] for code in self.columns[name]]
+
+    def sentence_bounds(self):
+        """Generator for the first and last+1 token index of each sentence."""
+        start = 0
+        for i in range(1, len(self.tokens) + 1):
+            if i == len(self.tokens) or self.sentence[i] != self.sentence[i - 1]:
+                yield start, i
+                start = i
+
+    def sentence_tokens(self) -> list:
+        """Get the tokens as list of sentences."""
+        return [self.tokens[start:end] for start, end in self.sentence_bounds()]
+
+    def to_dict(self) -> dict:
+        """Convert the table to a dict of lists that can be stored as json."""
+        return {
+            "sentences": self.sentence_tokens(),
+            "columns": {name: self.column(name) for name in self.columns},
+        }
+
+    @classmethod
+    def from_dict(cls, mydict: dict):
+        """Build the table from a dict created by to_dict."""
+        table = cls()
+        for sentence in mydict["sentences"]:
+            table.add_sentence(sentence)
+        for name, values in mydict["columns"].items():
+            table.add_column(name, values)
+        return table
+
+    @classmethod
+    def concat(cls, tables: list):
+        """Join tables with the same columns into one table, in order."""
+        table = cls()
+        for part in tables:
+            for sentence in part.sentence_tokens():
+                table.add_sentence(sentence)
+        names = list(tables[0].columns) if tables else []
+        for name in names:
+            table.add_column(
+                name, (tag for part in tables for tag in part.column(name))
+            )
+        return table
+
+    def split(self, nsentences: list) -> list:
+        """Split the table into consecutive tables, the reverse of concat.
+
+        Args:
+                nsentences[list]: Number of sentences of each table."""
+        columns = {name: self.column(name) for name in self.columns}
+        tables = []
+        start = 0
+        last = 0
+        for count in nsentences:
+            last += count
+            end = start
+            while end < len(self.tokens) and self.sentence[end] < last:
+                end += 1
+            table = type(self)()
+            for _, group in itertools.groupby(
+                range(start, end), key=self.sentence.__getitem__
+            ):
+                table.add_sentence([self.tokens[i] for i in group])
+            for name, column in columns.items():
+                table.add_column(name, column[start:end])
+            tables.append(table)
+            start = end
+        return tables
+
+    def lines(self):
+        """Generator for the lines of the .vrt output, one token per line."""
+        columns = [(self.columns[name], self.vocabs[name]) for name in self.columns]
+        for start, end in self.sentence_bounds():
+            yield "<s>\n"
+            for i in range(start, end):
+                yield (
+                    "\t".join(
+                        [self.tokens[i]]
+                        + [vocab[column[i]] for column, vocab in columns]
+                    )
+                    + "\n"
+                )
+            yield "</s>\n"
+
+    @classmethod
+    def from_lines(
+        cls, lines, fill: str = " ", names: list = None, escaped: bool = False
+    ):
+        """Build the table from .vrt lines, see iter_sentences for the sentences.
+
+        Args:
+                lines[iterable]: Lines of .vrt output, with or without linebreaks.
+                fill[str]: Tag for tokens that have fewer columns than others.
+                names[list]: Names of the columns, the columns without a name are
+                    numbered from 1.
+                escaped[bool]: The tokens are escaped as in .xml output."""
+        table = cls()
+        rows = []
+        for sentence in iter_sentences(lines, escaped):
+            table.add_sentence([row[0] for row in sentence])
+            rows.extend(row[1:] for row in sentence)
+        ncolumns = max([len(row) for row in rows], default=0)
+        names = names or []
+        for i in range(ncolumns):
+            table.add_column(
+                names[i] if i < len(names) else str(i + 1),
+                [row[i] if i < len(row) else fill for row in rows],
+            )
+        return table
+
+
+def iter_sentences(lines, escaped: bool = False):
+    """Generator for the sentences in .vrt lines, each a list of the token lines
+    split into their columns.
+
+    Tokens between <s> and </s> form a sentence. Tokens outside of <s> form a
+    sentence up to the next empty line or structural attribute, as in files with
+    one token per line. Other structural attributes are skipped. Lines with more
+    than one column are always tokens, so that a token such as <b> is kept.
+
+    Args:
+            lines[iterable]: Lines of .vrt output, with or without linebreaks.
+            escaped[bool]: The tokens are escaped as in .xml output, the markup is
+                told apart before the tokens are unescaped."""
+    sent = []
+    # if the tokens are enclosed in <s>
+    in_s = False
+    for line in lines:
+        line = line.rstrip("\n")
+        # markup has no columns
+        tag = line.strip() if "\t" not in line else None
+        if tag == "<s>" or tag == "</s>" or (tag and tag.startswith("<s ")):
+            if sent:
+                yield sent
+            sent = []
+            in_s = tag != "</s>"
+        elif tag == "" or (tag and STRUCT_TAG.match(tag)):
+            if sent and not in_s:
+                yield sent
+                sent = []
+        elif escaped:
+            sent.append([html.unescape(column) for column in line.split("\t")])
+        else:
+            sent.append(line.split("\t"))
+    if sent:
+        yield sent
@@ -0,0 +1,72 @@
+import json
+import os
+import shutil
+import sys
+import pytest
+
+# fake cwb tool that logs its arguments and what it reads from stdin, the output and
+# exit code are set by the environment variables CWB_OUTPUT and CWB_EXIT. cwb-encode
+# writes a file for each positional attribute and the registry file as CWB does.
+CWB_SCRIPT = """#!PYTHON
+import json, os, sys
+args = sys.argv[1:]
+encode = sys.argv[0].endswith("encode")
+stdin = sys.stdin.read() if "-f" not in args and encode else None
+log = os.path.join(os.path.dirname(__file__), "log.jsonl")
+with open(log, "a") as f:
+    f.write(json.dumps([os.path.basename(sys.argv[0])] + args + [stdin]) + "\\n")
+if encode and "-d" in args:
+    attributes = [] if "-p" in args else ["word"]
+    attributes += [args[i + 1] for i, arg in enumerate(args) if arg == "-P"]
+    structures = [args[i + 1].split(":")[0] for i, arg in enumerate(args) if arg == "-S"]
+    corpus_dir = args[args.index("-d") + 1]
+    os.makedirs(corpus_dir, exist_ok=True)
+    for name in attributes:
+        open(os.path.join(corpus_dir, name + ".corpus"), "w").close()
+    if "-R" in args:
+        registry = args[args.index("-R") + 1]
+        os.makedirs(os.path.dirname(registry), exist_ok=True)
+        with open(registry, "w") as f:
+            f.write("HOME {}\\n".format(corpus_dir))
+            f.writelines("ATTRIBUTE {}\\n".format(name) for name in attributes)
+            f.writelines("STRUCTURE {}\\n".format(name) for name in structures)
+sys.stdout.write(os.environ.get("CWB_OUTPUT", ""))
+sys.exit(int(os.environ.get("CWB_EXIT", 0)))
+"""
+
+
+@pytest.fixture(scope="session", autouse=True)
+def out_dir():
+    """Create the directory for the output files that the tests write."""
+    path = os.path.join(os.path.dirname(__file__), "out")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+@pytest.fixture
+def fake_cwb(tmp_path, monkeypatch):
+    """Put fake cwb tools on the PATH.
+
+    Returns:
+            callable: Gives the logged calls of the tools."""
+    bindir = tmp_path / "bin"
+    bindir.mkdir()
+    for name in ["cwb-encode", "cwb-makeall", "cwb-decode"]:
+        (bindir / name).write_text(CWB_SCRIPT.replace("PYTHON", sys.executable))
+        (bindir / name).chmod(0o755)
+    monkeypatch.setenv("PATH", "{}{}{}".format(bindir, os.pathsep, os.environ["PATH"]))
+
+    def get_log():
+        with open(bindir / "log.jsonl") as f:
+            return [json.loads(line) for line in f]
+
+    return get_log
+
+
+@pytest.fixture
+def cwb_dirs(request, tmp_path):
+    """Corpus and registry directories for the integration tests, the cwb tools are
+    faked if CWB is not installed."""
+    if shutil.which("cwb-encode") is None:
+        request.getfixturevalue("fake_cwb")
+    return str(tmp_path / "corpora") + "/", str(tmp_path / "registry") + "/"
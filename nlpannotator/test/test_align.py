@@ -0,0 +1,78 @@
+import nlpannotator.align as al
+
+
+def test_compact():
+    assert al.compact(" a b\n") == "ab"
+    assert al.compact("\n\n") == ""
+
+
+def test_get_spans():
+    text, spans = al.get_spans(["This", "is", "."])
+    assert text == "Thisis."
+    assert spans == [(0, 4), (4, 6), (6, 7)]
+
+
+def test_locate():
+    assert al.locate("Thisisatest.", ["This", "is", "a", "test", "."]) == [
+        0,
+        4,
+        6,
+        7,
+        11,
+    ]
+    # the tool replaced a token, the following tokens are found again
+    starts = al.locate("Gotowww.a.comnow.", ["Go", "to", "replaced-url", "now", "."])
+    assert starts == [0, 2, None, 13, 16]
+
+
+def test_align_exact():
+    index, stats = al.align_tokens(["This", "is", "a", "."], ["This", "is", "a", "."])
+    assert index == [0, 1, 2, 3]
+    assert stats["exact"] == 4
+    assert stats["unaligned"] == 0
+
+
+def test_align_split_merged():
+    base = ["I", "don't", "know", "New", "York", "."]
+    tool = ["I", "do", "n't", "know", "New York", "."]
+    index, stats = al.align_tokens(base, tool)
+    assert index == [0, 1, 3, 4, 4, 5]
+    assert stats == {
+        "tokens": 6,
+        "exact": 3,
+        "split": 1,
+        "merged": 2,
+        "unaligned": 0,
+        "tool_unplaced": 0,
+        "position": 0,
+    }
+
+
+def test_align_position():
+    # normalized tokens are paired by their position between aligned tokens
+    index, stats = al.align_tokens(['"', "Hi", '"'], ["''", "Hi", "''"])
+    assert index == [0, 1, 2]
+    assert stats["position"] == 2
+    assert stats["unaligned"] == 0
+    assert stats["tool_unplaced"] == 0
+    base = ["Go", "to", "www.a.com", "now", "."]
+    index, stats = al.align_tokens(base, ["Go", "to", "replaced-url", "now", "."])
+    assert index == [0, 1, 2, 3, 4]
+    assert stats["position"] == 1
+    # gaps of different lengths are not paired
+    index, stats = al.align_tokens(["a", "«", "»", "b"], ["a", "<<", "b"])
+    assert index == [0, None, None, 2]
+    assert stats["tool_unplaced"] == 1
+
+
+def test_align_unaligned():
+    base = ["This", "\n", "is", "www.a.com", "."]
+    tool = ["This", "is", "replaced-url", "."]
+    index, stats = al.align_tokens(base, tool)
+    # the whitespace token stays unaligned
+    assert index == [0, None, 1, 2, 3]
+    assert stats["unaligned"] == 1
+    assert stats["tool_unplaced"] == 0
+    # tools that return fewer tokens do not fail
+    index, stats = al.align_tokens(base, [])
+    assert index == [None] * 5
@@ -1,10 +1,13 @@
 import pytest
 import unittest.mock
+import copy
 import json
+import jsonschema
 import os
 import nlpannotator.base as be
 import nlpannotator.mtreetagger as mtt
 import nlpannotator.mspacy as msp
+import nlpannotator.table as tb
 import tempfile
 
 
@@ -52,43 +55,17 @@ def get_doc(load_dict, data_en):
 def test_token_en():
     token_en = ["<s>", "This", "is", "a", "sentence", ".", "</s>"]
     token_en_annotated = [
-        "<s>",
+        "<s>\n",
         "This\tDT\tthis\n",
         "is\tVBZ\tbe\n",
         "a\tDT\ta\n",
         "sentence\tNN\tsentence\n",
         ".\tSENT\t.\n",
-        "</s>",
+        "</s>\n",
     ]
     return token_en, token_en_annotated
 
 
-@pytest.fixture
-def test_en():
-    data = [
-        "<s>",
-        "This\tthis\n",
-        "is\tbe\n",
-        "a\ta\n",
-        "sentence\tsentence\n",
-        ".\t.\n",
-        "</s>",
-    ]
-    return data
-
-
-@pytest.fixture
-def test_en_sentence():
-    sentence = [
-        ("This\tthis", 1),
-        ("is\tbe", 2),
-        ("a\ta", 3),
-        ("sentence\tsentence", 4),
-        (".\t.", 5),
-    ]
-    return sentence
-
-
 @pytest.fixture
 def test_en_sentence2():
     sentence = ["<s>\n", "This\n", "is\n", "a\n", "sentence\n", ".\n", "</s>\n"]
@@ -131,28 +108,126 @@ def test_load_input_dict(init_dict):
     assert mydict == init_dict
 
 
+def test_get_processes():
+    mydict = {"advanced_options": {"multiprocessing": False}}
+    assert be.PrepareRun.get_processes(mydict, {}) == 1
+    assert be.PrepareRun.get_processes(mydict, {"n_process": 3}) == 3
+    mydict["advanced_options"]["multiprocessing"] = True
+    assert be.PrepareRun.get_processes(mydict, {}) == be.PrepareRun.get_cores()
+
+
+def test_model_pool():
+    loaded = []
+
+    def loader(subdict):
+        loaded.append(subdict["model"])
+        return subdict["model"]
+
+    pool = be.ModelPool(max_models=2)
+    assert pool.get("spacy", {"model": "a"}, loader) == "a"
+    assert pool.get("spacy", {"model": "a"}, loader) == "a"
+    assert loaded == ["a"]
+    assert pool.hits == 1 and pool.misses == 1
+    pool.get("spacy", {"model": "b"}, loader)
+    pool.get("spacy", {"model": "a"}, loader)
+    # b is least recently used and dropped
+    pool.get("stanza", {"model": "a"}, loader)
+    assert len(pool.models) == 2
+    pool.get("spacy", {"model": "a"}, loader)
+    pool.get("spacy", {"model": "b"}, loader)
+    assert loaded == ["a", "b", "a", "b"]
+    pool.configure(max_models=1)
+    assert list(pool.models) == [pool.get_key("spacy", {"model": "b"})]
+    pool.clear()
+    assert not pool.models
+
+
+def test_model_pool_release():
+    released = []
+
+    class Pipeline:
+        def __init__(self, subdict):
+            self.model = subdict["model"]
+
+        def release(self):
+            released.append(self.model)
+
+    pool = be.ModelPool(max_models=1)
+    pool.get("spacy", {"model": "a"}, Pipeline)
+    pool.get("spacy", {"model": "b"}, Pipeline)
+    assert released == ["a"]
+    pool.clear()
+    assert released == ["a", "b"]
+
+
+def test_get_chunks(tmp_path):
+    myfile = tmp_path / "text.txt"
+    myfile.write_text(
+        "This is\na sentence.\n\nThis is a second\nparagraph.\n\n\nEnd.\n"
+    )
+    chunks = list(be.PrepareRun.get_chunks(myfile))
+    # the paragraph boundaries are kept within the chunk
+    assert chunks == ["This is a sentence.\n\nThis is a second paragraph.\n\nEnd."]
+    assert chunks[0].split(be.PARAGRAPH_SEP) == [
+        "This is a sentence.",
+        "This is a second paragraph.",
+        "End.",
+    ]
+    chunks = list(be.PrepareRun.get_chunks(myfile, paragraphs=True))
+    assert chunks == [
+        "This is a sentence.",
+        "This is a second paragraph.",
+        "End.",
+    ]
+    chunks = list(be.PrepareRun.get_chunks(myfile, chunk_size=20))
+    assert chunks == ["This is a sentence.", "This is a second", "paragraph.\n\nEnd."]
+
+
+def test_as_chunks():
+    assert be.PrepareRun.as_chunks("This is a sentence.") == ["This is a sentence."]
+    assert be.PrepareRun.as_chunks(["a", "b"]) == ["a", "b"]
+
+
+def test_as_text():
+    assert be.PrepareRun.as_text(["This", "is", "."]) == "This is ."
+    assert be.PrepareRun.as_text("This is .") == "This is ."
+    assert be.PrepareRun.as_tokens("This is .") == ["This", "is", "."]
+    assert be.PrepareRun.as_tokens(["This", "is", "."]) == ["This", "is", "."]
+
+
 @pytest.mark.dictname("./test/data/input2.json")
 def test_validate_input_dict(init_dict):
     be.PrepareRun.validate_input_dict(init_dict)
+    init_dict["language"] = "xx"
+    with pytest.raises(jsonschema.exceptions.ValidationError):
+        be.PrepareRun.validate_input_dict(init_dict)
+
+
+def test_registry():
+    names = be.OutObject.get_names()
+    # loaded once and shared
+    assert be.OutObject.get_names() is names
+    assert be.registry.validator is be.registry.validator
+    assert names["spacy_names"]["pos"] == "pos_"
+    with pytest.raises(TypeError):
+        names["spacy_names"]["pos"] = "tag_"
 
 
 def test_iterate(load_dict, data_en, test_en_sentence2):
     annotated = msp.MySpacy(load_dict[1])
     annotated.apply_to(data_en)
     out_obj = msp.OutSpacy(annotated.doc, annotated.jobs, 0)
-    out = []
+    out = tb.TokenTable()
     for sent in annotated.doc.sents:
-        out.append("<s>\n")
         out = out_obj.iterate(out, sent)
-        out.append("</s>\n")
-    assert out == test_en_sentence2
+    assert list(out) == test_en_sentence2
 
 
 def test_iterate_tokens(get_doc, test_token_en):
     out_obj = mtt.OutTreetagger(get_doc[0], get_doc[1], 0)
     token_list = out_obj.token_list(out_obj.doc)
     out = out_obj.iterate_tokens(test_token_en[0], token_list)
-    assert out == test_token_en[1]
+    assert list(out) == test_token_en[1]
 
 
 def test_token_list(get_doc):
@@ -162,20 +237,6 @@ def test_token_list(get_doc):
     assert token_list == mylist
 
 
-def test_out_shortlist(get_doc, test_en, test_en_sentence):
-    out_obj = mtt.OutTreetagger(get_doc[0], get_doc[1], 0)
-    shortlist = out_obj.out_shortlist(test_en)
-    assert shortlist == test_en_sentence
-
-
-def test_compare_tokens(get_doc):
-    out_obj = mtt.OutTreetagger(get_doc[0], get_doc[1], 0)
-    mytoken1 = "English"
-    mytoken2 = "is"
-    assert out_obj._compare_tokens(mytoken1, mytoken1)
-    assert not out_obj._compare_tokens(mytoken1, mytoken2)
-
-
 def test_write_vrt():
     mystring = "abcdefgh"
     myfile = "test/out/test"
@@ -184,6 +245,26 @@ def test_write_vrt():
     assert test_string == mystring
 
 
+def test_write_vrt_stream():
+    lines = (line for line in ["<s>\n", "This \tDT\n", "is\tVBZ\n", "</s>\n"])
+    myfile = "test/out/test"
+    stats = be.OutObject.write_vrt(myfile, lines)
+    with open(myfile + ".vrt", "r") as f:
+        test_string = f.read()
+    assert test_string == "<s>\nThis\tDT\nis\tVBZ\n</s>\n"
+    assert stats == {"tokens": 2, "bytes": len(test_string)}
+
+
+def test_is_structural():
+    assert be.OutObject.is_structural("<s>\n")
+    assert be.OutObject.is_structural("</s>\n")
+    assert be.OutObject.is_structural('<text id="a">\n')
+    assert not be.OutObject.is_structural("<\tXY\n")
+    assert not be.OutObject.is_structural("This\tDT\n")
+    assert not be.OutObject.is_structural("<b>\n")
+    assert not be.OutObject.is_structural("<br/>\n")
+
+
 def test_write_xml():
     mystring = "abcdefgh"
     myfile = "test/out/test"
@@ -195,6 +276,23 @@ def test_write_xml():
     assert test_string == mystring2
 
 
+def test_write_xml_escape():
+    out = ["<s>\n", "AT&T\tPROPN\n", "<\tX\n", "<b>\n", "</s>\n"]
+    myfile = "test/out/test"
+    stats = be.OutObject.write_xml('a "b"', myfile, iter(out))
+    with open(myfile + ".xml", "r") as f:
+        lines = f.readlines()
+    assert lines[1] == '<corpus name="a &quot;b&quot;">\n'
+    assert lines[3:8] == [
+        "<s>\n",
+        "AT&amp;T\tPROPN\n",
+        "&lt;\tX\n",
+        "&lt;b&gt;\n",
+        "</s>\n",
+    ]
+    assert stats["tokens"] == 3
+
+
 def test_purge():
     inputs = [" ", "  "]
     outputs = ["", ""]
@@ -232,6 +330,109 @@ def test_setup(monkeypatch, get_obj):
     answers = iter(["n", "y", "y", "n", "n"])
     monkeypatch.setattr(my_attr, lambda _: next(answers))
     assert obj.setup() is False
+    # the corpus is overwritten without asking
+    monkeypatch.setattr(my_attr, lambda _: pytest.fail("setup asked for input"))
+    open(os.path.join(obj.encodedir, "old"), "w").close()
+    assert obj.setup(overwrite=True) is True
+    assert os.listdir(obj.encodedir) == []
+
+
+@pytest.fixture
+def cwb_tools(fake_cwb, tmp_path):
+    """Fake cwb tools that log their arguments and what they read from stdin."""
+    obj = be.encode_corpus(copy.deepcopy(test_dict))
+    obj.encodedir = str(tmp_path / "corpus") + "/"
+    obj.regdir = str(tmp_path / "registry") + "/"
+    return obj, fake_cwb
+
+
+def test_encode_lines(cwb_tools, monkeypatch):
+    obj, get_log = cwb_tools
+    table = tb.TokenTable()
+    table.add_sentence(["This", "is", "a", "test", "."])
+    table.add_column("pos", ["DT", "VBZ", "DT", "NN", "."])
+    stats = obj.encode_lines(table, ["pos"], ["s"])
+    assert stats["returncode"] == 0
+    assert stats["tokens"] == 5
+    assert stats["bytes"] == len("".join(table))
+    encode, makeall = get_log()
+    assert encode == [
+        "cwb-encode",
+        "-d",
+        obj.encodedir,
+        "-xsBC9",
+        "-c",
+        "utf8",
+        "-R",
+        obj.regdir + "test",
+        "-S",
+        "s",
+        "-P",
+        "pos",
+        "".join(table),
+    ]
+    assert makeall == ["cwb-makeall", "-r", obj.regdir, "-V", "test", None]
+    assert os.path.isdir(obj.encodedir)
+    # the exit code of a failing tool is reported
+    monkeypatch.setenv("CWB_EXIT", "2")
+    monkeypatch.setattr("builtins.input", lambda _: "y")
+    with pytest.raises(RuntimeError, match="code 2"):
+        obj.encode_lines(table, ["pos"], ["s"])
+
+
+def test_encode_vrt_file(cwb_tools):
+    obj, get_log = cwb_tools
+    obj.encode_vrt(["pos"], None)
+    encode = get_log()[0]
+    assert encode[6:9] == ["-f", obj.outname + ".vrt", "-R"]
+    assert encode[-3:] == ["-P", "pos", None]
+
+
+def test_add_tags_to_corpus(cwb_tools, tmp_path):
+    obj, get_log = cwb_tools
+    mydict = copy.deepcopy(test_dict)
+    mydict["advanced_options"]["corpus_dir"] = obj.encodedir
+    mydict["advanced_options"]["registry_dir"] = obj.regdir
+    os.makedirs(obj.regdir)
+    with open(obj.regdir + "test", "w") as f:
+        f.write("NAME test\nATTRIBUTE word\nATTRIBUTE pos\nSTRUCTURE s\n")
+    table = tb.TokenTable()
+    table.add_sentence(["This", "is", "."])
+    table.add_column("pos", ["DT", "VBZ", "."])
+    table.add_column("lemma", ["this", "be", "."])
+    stats = be.encode_corpus.add_tags_to_corpus(
+        mydict, ["pos", "lemma"], ["s"], out=table
+    )
+    assert stats["ptags"] == ["pos_stanza", "lemma"]
+    assert stats["stags"] == []
+    encode, makeall = get_log()
+    assert encode[-7:-1] == ["-p", "-", "-P", "pos_stanza", "-P", "lemma"]
+    # the words are not encoded again
+    assert encode[-1] == "<s>\nDT\tthis\nVBZ\tbe\n.\t.\n</s>\n"
+    assert makeall[0] == "cwb-makeall"
+    registry_file = be.CorpusRegistry.read(obj.regdir + "test")
+    assert registry_file.attributes == ["word", "pos", "pos_stanza", "lemma"]
+    assert registry_file.structures == ["s"]
+    # the annotation of the tool is already present
+    with pytest.raises(RuntimeError):
+        registry_file.get_new_attributes(["pos"], "stanza")
+
+
+def test_decode_lines(cwb_tools, monkeypatch):
+    _, get_log = cwb_tools
+    obj = be.decode_corpus(copy.deepcopy(test_dict))
+    monkeypatch.setenv(
+        "CWB_OUTPUT", "<s>\nThis\nis\n.\n</s>\n<s>\nIt\nworks\n.\n</s>\n"
+    )
+    assert list(obj.decode_lines())[:2] == ["<s>\n", "This\n"]
+    assert get_log()[0][1:5] == ["-C", "-r", obj.regdir, "test"]
+    assert get_log()[0][5:-1] == ["-ALL"]
+    assert list(obj.decode_sentences()) == [["This", "is", "."], ["It", "works", "."]]
+    assert get_log()[1][5:-1] == ["-P", "word", "-S", "s"]
+    assert obj.decode_table().sentence_tokens()[1] == ["It", "works", "."]
+    monkeypatch.setenv("CWB_EXIT", "1")
+    with pytest.raises(RuntimeError):
+        list(obj.decode_lines())
 
 
 @unittest.mock.patch("os.system")
@@ -0,0 +1,81 @@
+import time
+import pytest
+import nlpannotator.cache as ac
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ac.AnnotationCache(str(tmp_path / "cache.db"))
+    yield cache
+    cache.close()
+
+
+def test_get_key():
+    key = ac.AnnotationCache.get_key("spacy:{}", "This", "is")
+    assert key == ac.AnnotationCache.get_key("spacy:{}", "This", "is")
+    assert key != ac.AnnotationCache.get_key("spacy:{}", "This is")
+    assert key != ac.AnnotationCache.get_key("stanza:{}", "This", "is")
+
+
+def test_put_get(cache):
+    assert cache.get("a") is None
+    cache.put("a", {"pos": ["DT", "VBZ"]})
+    assert cache.get("a") == {"pos": ["DT", "VBZ"]}
+    cache.put_many([("b", [1]), ("c", [2])])
+    assert cache.get_many(["c", "d", "b"]) == [[2], None, [1]]
+    assert cache.hits == 3
+    assert cache.misses == 2
+    assert len(cache) == 3
+
+
+def test_evict(cache):
+    for key in ["a", "b", "c"]:
+        cache.put(key, "x" * 1000)
+    # make a the least recently used entry
+    cache.db.execute("UPDATE annotations SET atime = 0 WHERE key = 'a'")
+    cache.db.commit()
+    assert cache.evict() == 0
+    cache.max_size = 2500 / 1024**2
+    assert cache.evict() == 1
+    assert cache.get("a") is None
+    cache.max_size = None
+    cache.max_age = 1
+    cache.db.execute("UPDATE annotations SET atime = ?", (time.time() - 2 * 86400,))
+    cache.db.commit()
+    assert cache.evict() == 2
+    assert len(cache) == 0
+
+
+def test_atime(cache, monkeypatch):
+    cache.put("a", [1])
+    cache.db.execute("UPDATE annotations SET atime = 0")
+    cache.db.commit()
+
+    def get_atime():
+        return cache.db.execute("SELECT atime FROM annotations").fetchone()[0]
+
+    # the access time is not written on every lookup
+    assert cache.get("a") == [1]
+    assert get_atime() == 0
+    # but before the entries are evicted
+    cache.evict()
+    assert get_atime() > 0
+    # or once a batch of entries was read
+    monkeypatch.setattr(ac, "SQL_BATCH", 2)
+    cache.db.execute("UPDATE annotations SET atime = 0")
+    cache.put("b", [2])
+    cache.get("a")
+    assert get_atime() == 0
+    cache.get("b")
+    assert get_atime() > 0
+
+
+def test_get_cache(tmp_path):
+    mydict = {"advanced_options": {}}
+    assert ac.get_cache(mydict) is None
+    mydict["advanced_options"]["cache"] = str(tmp_path / "new" / "cache.db")
+    mydict["advanced_options"]["cache_max_size"] = 10
+    cache = ac.get_cache(mydict)
+    assert cache is ac.get_cache(mydict)
+    assert cache.max_size == 10
+    assert cache.stats() == {"hits": 0, "misses": 0, "entries": 0, "size": 0}
@@ -0,0 +1,92 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import pytest
+import nlpannotator.base as be
+import nlpannotator.daemon as dm
+
+
+@pytest.fixture
+def config(tmp_path):
+    mydict = be.PrepareRun.load_input_dict("./test/data/input.json")
+    mydict["tool"] = "somajo"
+    mydict["processing_option"] = "manual"
+    mydict["processing_type"] = "sentencize, tokenize"
+    mydict["advanced_options"]["output_format"] = "vrt"
+    mydict["advanced_options"]["output_dir"] = str(tmp_path) + "/"
+    path = tmp_path / "somajo.json"
+    path.write_text(json.dumps(mydict))
+    return str(path)
+
+
+@pytest.fixture
+def server(config):
+    annotator = dm.Annotator([config])
+    annotator.warm_up()
+    server = dm.get_server(annotator, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, job, content_type="application/json"):
+    host, port = server.server_address
+    request = urllib.request.Request(
+        "http://{}:{}/annotate".format(host, port),
+        data=json.dumps(job).encode("utf-8"),
+        headers={"Content-Type": content_type},
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def test_annotator(config, tmp_path):
+    annotator = dm.Annotator([config])
+    assert annotator.get_name() == "somajo"
+    with pytest.raises(KeyError):
+        annotator.get_name("spacy")
+    result = annotator.annotate(None, "This is a sentence.\nThis is another one.")
+    assert result["output"] == (
+        "<s>\nThis\nis\na\nsentence\n.\n</s>\n<s>\nThis\nis\nanother\none\n.\n</s>\n"
+    )
+    result = annotator.annotate("somajo", "This is a sentence.", outname="test")
+    assert result["tokens"] == 5
+    assert (tmp_path / "test.vrt").exists()
+    for outname in ["../test", "/tmp/test", "sub/test", "", ".."]:
+        with pytest.raises(ValueError):
+            annotator.annotate("somajo", "This is a sentence.", outname=outname)
+
+
+def test_server(server):
+    result = post(server, {"text": "This is a sentence."})
+    assert result["output"] == "<s>\nThis\nis\na\nsentence\n.\n</s>\n"
+    host, port = server.server_address
+    with urllib.request.urlopen("http://{}:{}/status".format(host, port)) as response:
+        status = json.loads(response.read())
+    assert status["configs"] == ["somajo"]
+    assert status["jobs"] == 2
+
+
+def test_server_errors(server, monkeypatch):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post(server, {"text": "Test.", "outname": "../test"})
+    assert error.value.code == 400
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post(server, {"text": "Test."}, content_type="text/plain")
+    assert error.value.code == 415
+    for job in [[], "x", None, {"text": ["Test."]}]:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            post(server, job)
+        assert error.value.code == 400
+
+    def fail(*args):
+        raise TypeError("tool failed")
+
+    monkeypatch.setattr(server.annotator, "annotate", fail)
+    with pytest.raises(urllib.error.HTTPError) as error:
+        post(server, {"text": "Test."})
+    assert error.value.code == 500
+    assert json.loads(error.value.read()) == {"error": "TypeError: tool failed"}
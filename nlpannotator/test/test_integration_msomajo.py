@@ -13,13 +13,13 @@ def setup():
     return mydict, text
 
 
-def test_integration_msomajo(setup):
+def test_integration_msomajo(setup, cwb_dirs):
     mydict, text = setup
     mydict["somajo_dict"]["model"] = "en_PTB"
     mydict["somajo_dict"]["processors"] = "sentencize", "tokenize"
     mydict["advanced_options"]["output_dir"] = "./test/out/"
-    mydict["advanced_options"]["corpus_dir"] = "./test/corpora/"
-    mydict["advanced_options"]["registry_dir"] = "./test/registry/"
+    mydict["advanced_options"]["corpus_dir"] = cwb_dirs[0]
+    mydict["advanced_options"]["registry_dir"] = cwb_dirs[1]
     tokenized = mso.MySomajo(mydict["somajo_dict"])
     tokenized.apply_to(text)
     # we should not need start ..?
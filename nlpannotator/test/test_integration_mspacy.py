@@ -10,7 +10,7 @@ def load_data():
     return data
 
 
-def test_integration_mspacy(load_data):
+def test_integration_mspacy(load_data, cwb_dirs):
     mydict = be.PrepareRun.load_input_dict("data/input.json")
     mydict["language"] = "en"
     mydict["document_type"] = "text"
@@ -18,6 +18,8 @@ def test_integration_mspacy(load_data):
     mydict["processing_type"] = "tokenize, pos, lemma"
     mydict["input"] = "./test/data/example_en.txt"
     mydict["advanced_options"]["output_dir"] = "./test/out/"
+    mydict["advanced_options"]["corpus_dir"] = cwb_dirs[0]
+    mydict["advanced_options"]["registry_dir"] = cwb_dirs[1]
     be.PrepareRun.validate_input_dict(mydict)
     obj = pe.SetConfig(mydict)
     spacy_dict = obj.mydict["spacy_dict"]
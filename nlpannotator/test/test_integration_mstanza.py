@@ -11,7 +11,7 @@ def load_data():
     return data
 
 
-def test_integration_mstanza(load_data):
+def test_integration_mstanza(load_data, cwb_dirs):
     # read in input.json
     mydict = be.PrepareRun.load_input_dict("data/input.json")
     mydict["input"] = "test/data/example_de.txt"
@@ -21,6 +21,8 @@ def test_integration_mstanza(load_data):
     mydict["processing_option"] = "manual"
     mydict["processing_type"] = "tokenize,pos,mwt,lemma"
     mydict["advanced_options"]["output_dir"] = "./test/out/"
+    mydict["advanced_options"]["corpus_dir"] = cwb_dirs[0]
+    mydict["advanced_options"]["registry_dir"] = cwb_dirs[1]
     # validate the input dict
     be.PrepareRun.validate_input_dict(mydict)
     # load the pipe object for updating dict with settings
@@ -2,13 +2,15 @@ import nlpannotator.base as be
 import nlpannotator.mtreetagger as mtt
 
 
-def test_integration_mtreetagger():
+def test_integration_mtreetagger(cwb_dirs):
     data = "This is a sentence."
     mydict = be.PrepareRun.load_input_dict("data/input.json")
     mydict["tool"] = "treetagger"
     mydict["treetagger_dict"]["processors"] = "tokenize", "pos", "lemma"
     mydict["input"] = "./test/data/example_en.txt"
     mydict["advanced_options"]["output_dir"] = "./test/out/"
+    mydict["advanced_options"]["corpus_dir"] = cwb_dirs[0]
+    mydict["advanced_options"]["registry_dir"] = cwb_dirs[1]
 
     treetagger_dict = mydict["treetagger_dict"]
     annotated = mtt.MyTreetagger(treetagger_dict)
@@ -1,6 +1,12 @@
+import os
 import pytest
+import subprocess
+import sys
+import types
+import nlpannotator
 import nlpannotator.main as mn
 import nlpannotator.base as be
+import nlpannotator.pipe as pe
 
 
 @pytest.fixture
@@ -30,6 +36,13 @@ def test_call_spacy(load_dict, data_en, test_en):
     assert out_obj.sentences == test_en
 
 
+def test_call_spacy_list(load_dict, test_en):
+    load_dict["processing_type"] = "sentencize"
+    data = test_en + ["This is another sentence."]
+    out_obj = mn.call_spacy(load_dict, data, islist=True)
+    assert [str(doc) for doc in out_obj.doc] == data
+
+
 def test_call_stanza(load_dict, data_en, test_en):
     load_dict["stanza_dict"]["processors"] = "tokenize,pos"
     out_obj = mn.call_stanza(load_dict, data_en)
@@ -58,3 +71,375 @@ def test_call_flair(load_dict, data_en):
     load_dict["flair_dict"]["model"] = "pos"
     out_obj = mn.call_flair(load_dict, data_en)
     assert out_obj.ptags == []
+
+
+@pytest.fixture
+def corpus(load_dict, tmp_path):
+    load_dict["tool"] = "somajo"
+    load_dict["processing_option"] = "manual"
+    load_dict["processing_type"] = "sentencize, tokenize"
+    load_dict["advanced_options"]["output_format"] = "vrt"
+    load_dict["advanced_options"]["output_dir"] = str(tmp_path) + "/"
+    pe.SetConfig(load_dict)
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    (docs / "b.txt").write_text("Here is two.")
+    (docs / "a.txt").write_text("Here is one.\nAnd more.")
+    return load_dict, docs
+
+
+def test_get_inputs(corpus):
+    _, docs = corpus
+    paths = [str(docs / "a.txt"), str(docs / "b.txt")]
+    assert mn.get_inputs(str(docs)) == paths
+    assert mn.get_inputs(str(docs / "*.txt")) == paths
+    assert mn.get_inputs(paths[1]) == paths[1:]
+    with pytest.raises(FileNotFoundError):
+        mn.get_inputs(str(docs / "*.vrt"))
+
+
+def test_get_worker_dict(corpus):
+    mydict, _ = corpus
+    mydict["advanced_options"]["multiprocessing"] = True
+    mydict["spacy_dict"]["n_process"] = 4
+    worker_dict = mn.get_worker_dict(mydict)
+    assert worker_dict["advanced_options"]["multiprocessing"] is False
+    for mytool in mn.backends:
+        subdict = worker_dict[mytool + "_dict"]
+        assert be.PrepareRun.get_processes(worker_dict, subdict) == 1
+    # the input dict is not changed
+    assert mydict["spacy_dict"]["n_process"] == 4
+
+
+def test_get_text_ids(tmp_path):
+    paths = [str(tmp_path / "a" / "doc.txt"), str(tmp_path / "b" / "doc.txt")]
+    assert mn.get_text_ids(paths) == ["a/doc", "b/doc"]
+    assert mn.get_text_ids(paths[:1]) == ["doc"]
+    with pytest.raises(ValueError):
+        mn.get_text_ids([str(tmp_path / "doc.txt"), str(tmp_path / "doc.vrt")])
+
+
+@pytest.mark.parametrize("multiprocessing", [False, True])
+def test_run_corpus(corpus, multiprocessing):
+    mydict, docs = corpus
+    mydict["advanced_options"]["multiprocessing"] = multiprocessing
+    stats = mn.run_corpus(mydict, mn.get_inputs(str(docs)))
+    with open(mydict["advanced_options"]["output_dir"] + "test-corpus.vrt") as f:
+        out = f.read()
+    assert out == (
+        '<text id="a">\n<s>\nHere\nis\none\n.\n</s>\n<s>\nAnd\nmore\n.\n</s>\n</text>\n'
+        '<text id="b">\n<s>\nHere\nis\ntwo\n.\n</s>\n</text>\n'
+    )
+    assert stats["tokens"] == 11
+
+
+def test_run_corpus_encode(corpus, monkeypatch):
+    mydict, docs = corpus
+    mydict["advanced_options"]["encode"] = True
+    encoded = []
+
+    def encode_lines(self, out, ptags, stags, style, text, overwrite):
+        encoded.append((list(out), ptags, stags, style, text, overwrite))
+        return {"returncode": 0}
+
+    monkeypatch.setattr(mn.be.encode_corpus, "encode_lines", encode_lines)
+    stats = mn.run_corpus(mydict, mn.get_inputs(str(docs)))
+    assert stats == {"returncode": 0}
+    lines, ptags, stags, style, text, overwrite = encoded[0]
+    assert lines[:3] == ['<text id="a">\n', "<s>\n", "Here\n"]
+    assert lines[-1] == "</text>\n"
+    assert (ptags, stags, style, text) == (None, ["s", "text:0+id"], "STR", False)
+    # an existing corpus is only overwritten if the user agrees
+    assert overwrite is False
+    assert not os.path.isfile(
+        mydict["advanced_options"]["output_dir"] + "test-corpus.vrt"
+    )
+
+
+def test_run_corpus_incremental(corpus, tmp_path, monkeypatch):
+    mydict, docs = corpus
+    mydict["advanced_options"]["incremental"] = True
+    mydict["advanced_options"]["corpus_dir"] = str(tmp_path / "corpora") + "/"
+    outname = mydict["advanced_options"]["output_dir"] + "test-corpus.vrt"
+    annotate = mn.annotate
+    calls = []
+
+    def count_annotate(mydict, data):
+        calls.append(data)
+        return annotate(mydict, data)
+
+    monkeypatch.setattr(mn, "annotate", count_annotate)
+    stats = mn.run_corpus(mydict, mn.get_inputs(str(docs)))
+    assert (stats["annotated"], stats["unchanged"]) == (2, 0)
+    with open(outname) as f:
+        out = f.read()
+    # nothing changed, the output is written from the fragments
+    calls.clear()
+    stats = mn.run_corpus(mydict, mn.get_inputs(str(docs)))
+    assert calls == []
+    assert (stats["annotated"], stats["unchanged"]) == (0, 2)
+    with open(outname) as f:
+        assert f.read() == out
+    # only the changed and the new document are annotated
+    (docs / "b.txt").write_text("Here is three.")
+    (docs / "c.txt").write_text("New.")
+    (docs / "a.txt").unlink()
+    stats = mn.run_corpus(mydict, mn.get_inputs(str(docs)))
+    assert len(calls) == 2
+    assert (stats["annotated"], stats["unchanged"]) == (2, 0)
+    with open(outname) as f:
+        assert f.read() == (
+            '<text id="b">\n<s>\nHere\nis\nthree\n.\n</s>\n</text>\n'
+            '<text id="c">\n<s>\nNew\n.\n</s>\n</text>\n'
+        )
+    fragment_dir = mn.get_fragment_dir(mydict)
+    assert sorted(os.listdir(fragment_dir)) == ["b.vrt", "c.vrt", "manifest.json"]
+    # documents of the same name in different directories are kept apart
+    (docs / "sub").mkdir()
+    (docs / "sub" / "b.txt").write_text("Other.")
+    stats = mn.run_corpus(mydict, [str(path) for path in sorted(docs.rglob("*.txt"))])
+    assert (stats["annotated"], stats["unchanged"]) == (1, 2)
+    with open(outname) as f:
+        assert '<text id="sub/b">\n<s>\nOther\n.\n</s>\n</text>\n' in f.read()
+    # a change of the configuration annotates all documents again
+    mydict["processing_type"] = "tokenize, sentencize"
+    stats = mn.run_corpus(mydict, mn.get_inputs(str(docs)))
+    assert stats["annotated"] == 2
+
+
+def test_run_corpus_incremental_encode(corpus, fake_cwb, tmp_path, monkeypatch):
+    mydict, docs = corpus
+    mydict["advanced_options"]["incremental"] = True
+    mydict["advanced_options"]["encode"] = True
+    mydict["advanced_options"]["corpus_dir"] = str(tmp_path / "corpora") + "/"
+    mydict["advanced_options"]["registry_dir"] = str(tmp_path / "registry") + "/"
+    monkeypatch.setattr("builtins.input", lambda _: pytest.fail("asked for input"))
+    stats = mn.run_corpus(mydict, mn.get_inputs(str(docs)))
+    assert (stats["returncode"], stats["annotated"]) == (0, 2)
+    # the existing corpus is encoded again without asking
+    (docs / "b.txt").write_text("Here is three.")
+    stats = mn.run_corpus(mydict, mn.get_inputs(str(docs)))
+    assert (stats["returncode"], stats["annotated"]) == (0, 1)
+    encodes = [call for call in fake_cwb() if call[0] == "cwb-encode"]
+    assert len(encodes) == 2
+    assert "three" in encodes[1][-1]
+
+
+@pytest.fixture
+def fake_treetagger(corpus, monkeypatch):
+    mydict, _ = corpus
+    mydict["tool"] = ["somajo", "somajo", "treetagger"]
+    mydict["processing_type"] = ["sentencize", "tokenize", "pos"]
+    mtt = mn.get_backend("treetagger")
+    calls = []
+
+    def call_treetagger(mydict, data, islist, style):
+        # tag the tokens without treetagger
+        calls.append(data)
+        doc = [
+            mtt.TreetaggerToken(token, "X", token.lower())
+            for sentence in data
+            for token in sentence
+        ]
+        return mtt.OutTreetagger(doc, ("pos", "lemma"), 0, style)
+
+    monkeypatch.setitem(mn.call_tool, "treetagger", call_treetagger)
+    return mydict, calls
+
+
+def test_annotate_table(fake_treetagger, monkeypatch):
+    mydict, calls = fake_treetagger
+    lines = ["<s>\n", "Here\n", "is\n", "one\n", ".\n", "</s>\n"]
+    monkeypatch.setattr(mn.be.decode_corpus, "decode_lines", lambda *args: lines)
+    table = mn.read_corpus(mydict, "other")
+    assert mn.get_token_tools(mydict) == ["treetagger"]
+    # the sentencizer is skipped
+    out, ptags, stags = mn.annotate(mydict, None, table=table)
+    assert calls == [[["Here", "is", "one", "."]]]
+    assert ptags == ["pos", "lemma"]
+    assert stags == ["s"]
+    assert list(out)[1] == "Here\tX\there\n"
+
+
+def test_run_cwb_encode(fake_treetagger, fake_cwb, tmp_path, monkeypatch):
+    mydict, calls = fake_treetagger
+    options = mydict["advanced_options"]
+    options["corpus_dir"] = str(tmp_path / "corpora") + "/"
+    options["registry_dir"] = str(tmp_path / "registry") + "/"
+    # encode a corpus with its own attributes
+    table = mn.tb.TokenTable()
+    table.add_sentence(["Here", "is", "one", "."])
+    table.add_column("pos", ["ADV", "VBZ", "CD", "."])
+    mydict["corpus_name"] = "old"
+    mn.encode_out(mydict, table, ["pos"], ["s", "text:0+id"], text=False)
+    files = sorted(os.listdir(options["corpus_dir"]))
+    assert files == ["pos.corpus", "word.corpus"]
+    # annotate the corpus again and encode the new layers
+    mydict["corpus_name"] = "new"
+    options["input_format"] = "cwb"
+    options["encode"] = True
+    monkeypatch.setenv("CWB_OUTPUT", "<s>\nHere\nis\none\n.\n</s>\n")
+    monkeypatch.setattr(mn, "get_config", lambda path_json: mydict)
+    mn.run(None, "old")
+    assert calls == [[["Here", "is", "one", "."]]]
+    # the files of the corpus are kept
+    assert sorted(os.listdir(options["corpus_dir"])) == [
+        "lemma.corpus",
+        "pos.corpus",
+        "pos_treetagger.corpus",
+        "word.corpus",
+    ]
+    registry_file = be.CorpusRegistry.read(options["registry_dir"] + "old")
+    assert registry_file.attributes == ["word", "pos", "pos_treetagger", "lemma"]
+    assert registry_file.structures == ["s", "text"]
+
+
+def test_run_corpus_vrt(fake_treetagger, tmp_path):
+    mydict, calls = fake_treetagger
+    mydict["advanced_options"]["input_format"] = "vrt"
+    docs = tmp_path / "vrt"
+    docs.mkdir()
+    (docs / "a.vrt").write_text("<s>\nHere\tADV\nis\tVBZ\n</s>\n")
+    (docs / "b.txt").write_text("One\nper\nline\n\nAgain\n")
+    stats = mn.run_corpus(mydict, mn.get_inputs(str(docs)))
+    # the tokens are taken from the input, the old annotations are dropped
+    assert calls == [[["Here", "is"]], [["One", "per", "line"], ["Again"]]]
+    assert stats["tokens"] == 6
+    with open(mydict["advanced_options"]["output_dir"] + "test-corpus.vrt") as f:
+        assert f.readlines()[:4] == [
+            '<text id="a">\n',
+            "<s>\n",
+            "Here\tX\there\n",
+            "is\tX\tis\n",
+        ]
+
+
+def test_annotate_layer(fake_treetagger, tmp_path):
+    mydict, calls = fake_treetagger
+    mydict["advanced_options"]["input_format"] = "vrt"
+    mydict["advanced_options"]["input_columns"] = ["pos", "ner"]
+    path = str(tmp_path / "old.xml")
+    mn.be.OutObject.write_xml(
+        "old",
+        path[:-4],
+        ["<s>\n", "AT&T\tPROPN\tORG\n", "is\tVBZ\n", "<b>\tX\n", "</s>\n"],
+    )
+    out, ptags, stags = mn.annotate_input(mydict, path)
+    # only the new layer is annotated, the columns of the input are kept
+    assert calls == [[["AT&T", "is", "<b>"]]]
+    assert stags == ["s"]
+    assert ptags == ["pos", "ner", "pos_2", "lemma"]
+    assert list(out)[1:3] == [
+        "AT&T\tPROPN\tORG\tX\tat&t\n",
+        "is\tVBZ\t{}\tX\tis\n".format(mn.be.NOT_DEF),
+    ]
+    # all columns of the input must be named
+    mydict["advanced_options"]["input_columns"] = ["pos"]
+    with pytest.raises(ValueError):
+        mn.annotate_input(mydict, path)
+
+
+def test_annotate_cached(fake_treetagger, tmp_path, monkeypatch):
+    mydict, calls = fake_treetagger
+    mydict["advanced_options"]["cache"] = str(tmp_path / "cache" / "annotations.db")
+    out, ptags, stags = mn.annotate(mydict, "Here is one. And more.")
+    assert calls == [[["Here", "is", "one", "."], ["And", "more", "."]]]
+    assert ptags == ["pos", "lemma"]
+    assert stags == ["s"]
+    lines = list(out)
+    assert lines[1] == "Here\tX\there\n"
+    # the same text is taken from the cache
+    calls.clear()
+    out, ptags, _ = mn.annotate(mydict, "Here is one. And more.")
+    assert calls == []
+    assert list(out) == lines
+    assert ptags == ["pos", "lemma"]
+    # only the new sentence is annotated
+    out, _, _ = mn.annotate(mydict, "Here is one. This is new.")
+    assert calls == [[["This", "is", "new", "."]]]
+    assert list(out)[-3:] == ["new\tX\tnew\n", ".\tX\t.\n", "</s>\n"]
+    cache = mn.ac.get_cache(mydict)
+    assert cache.hits == 4
+    assert cache.misses == 5
+    # the sentencizer runs only on the changed chunk
+    sentencized = []
+    annotate_sent = mn.annotate_sent
+
+    def count_sent(mydict, mytool, data, style):
+        sentencized.extend(data)
+        return annotate_sent(mydict, mytool, data, style)
+
+    monkeypatch.setattr(mn, "annotate_sent", count_sent)
+    mn.annotate(mydict, iter(["Here is one.", "And more."]))
+    assert sentencized == ["Here is one.", "And more."]
+    sentencized.clear()
+    out, _, _ = mn.annotate(mydict, iter(["Here is one.", "Changed now."]))
+    assert sentencized == ["Changed now."]
+    assert out.sentence_tokens() == [
+        ["Here", "is", "one", "."],
+        ["Changed", "now", "."],
+    ]
+
+
+def test_annotate_cached_batch(corpus, tmp_path, monkeypatch):
+    mydict, _ = corpus
+    mydict["advanced_options"]["cache"] = str(tmp_path / "cache" / "annotations.db")
+    calls = []
+
+    def call_sentencizer(mydict, data, islist, style):
+        # one doc with one sentence for each chunk
+        calls.append(list(data))
+        docs = [
+            types.SimpleNamespace(
+                sents=[[types.SimpleNamespace(text=text) for text in chunk.split()]]
+            )
+            for chunk in data
+        ]
+        out_obj = be.OutObject(docs, [], 0, style)
+        out_obj.attrnames = {"sentence": "sents"}
+        out_obj.stags = ["s"]
+        return out_obj
+
+    monkeypatch.setitem(mn.call_tool, "somajo", call_sentencizer)
+    mn.annotate(mydict, iter(["a b", "c d", "e"]))
+    assert calls == [["a b", "c d", "e"]]
+    # the chunks that are not cached are annotated in one call
+    out, _, stags = mn.annotate(mydict, iter(["a b", "x y", "e", "z"]))
+    assert calls[1:] == [["x y", "z"]]
+    assert out.sentence_tokens() == [["a", "b"], ["x", "y"], ["e"], ["z"]]
+    assert stags == ["s"]
+
+
+def test_run_corpus_cache_counts(corpus, tmp_path, monkeypatch):
+    mydict, docs = corpus
+    mydict["advanced_options"]["cache"] = str(tmp_path / "cache" / "annotations.db")
+    mydict["advanced_options"]["multiprocessing"] = True
+    monkeypatch.setattr(mn.be.PrepareRun, "get_cores", lambda: 2)
+    mn.run_corpus(mydict, mn.get_inputs(str(docs)))
+    mn.run_corpus(mydict, mn.get_inputs(str(docs)))
+    # the workers report their hits and misses
+    cache = mn.ac.get_cache(mydict)
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_lazy_backends():
+    # importing the package does not import the backends
+    code = (
+        "import sys, nlpannotator; "
+        "print(' '.join(sorted(set(sys.modules) & {'spacy', 'stanza', 'flair'})))"
+    )
+    # make the package importable as in this process
+    path = os.path.dirname(os.path.dirname(nlpannotator.__file__))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([path] + sys.path)
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+    )
+    assert result.stdout.strip() == ""
+    assert mn.get_backend("somajo").MySomajo is nlpannotator.MySomajo
+    with pytest.raises(AttributeError):
+        nlpannotator.MyTool
@@ -16,13 +16,13 @@ def data_en_list():
 @pytest.fixture
 def test_en():
     data = [
-        "<s>",
+        "<s>\n",
         "This\tDT\n",
         "is\tVBZ\n",
         "a\tDT\n",
         "sentence\tNN\n",
         ".\t.\n",
-        "</s>",
+        "</s>\n",
     ]
     return data
 
@@ -75,7 +75,7 @@ def test_assemble_output_tokens(get_doc, test_en):
     out = ["<s>", "This", "is", "a", "sentence", ".", "</s>"]
     out = out_obj.assemble_output_tokens(out)
     print(out)
-    assert out == test_en
+    assert list(out) == test_en
 
 
 def test_grab_tag(get_doc):
@@ -96,3 +96,13 @@ def test_sentence_token_list(load_dict, data_en_list):
     out = out_obj.sentence_token_list(doc)
     assert out[0].text == "This"
     assert out[7].text == "another"
+
+
+def test_apply_to_list(load_dict):
+    annotated = mf.MyFlair(load_dict)
+    data = [["This", "is", "a", "sentence", "."], "This is another sentence ."]
+    annotated.apply_to_list(data, mini_batch_size=1)
+    assert len(annotated.doc) == 2
+    assert annotated.doc[0][3].text == "sentence"
+    assert annotated.doc[0][3].get_label("pos").value == "NN"
+    assert annotated.doc[1][2].text == "another"
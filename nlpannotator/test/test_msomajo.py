@@ -1,6 +1,7 @@
 import pytest
 import nlpannotator.base as be
 import nlpannotator.msomajo as mso
+import nlpannotator.table as tb
 
 test_out_en = [
     "<s>\n",
@@ -193,7 +194,7 @@ def load_dict():
 def get_doc(read_data_en, load_dict):
     tokenized = mso.MySomajo(load_dict["somajo_dict"])
     tokenized.apply_to(read_data_en)
-    return tokenized.doc, tokenized.jobs
+    return list(tokenized.doc), tokenized.jobs
 
 
 def test_mysomajo_init(load_dict):
@@ -207,11 +208,43 @@ def test_mysomajo_init(load_dict):
 def test_apply_to(read_data_en, read_data_de, load_dict):
     tokenized = mso.MySomajo(load_dict["somajo_dict"])
     tokenized.apply_to(read_data_en)
-    assert tokenized.doc[0][8].text == "software"
+    assert list(tokenized.doc)[0][8].text == "software"
     load_dict["somajo_dict"]["model"] = "de_CMC"
     tokenized = mso.MySomajo(load_dict["somajo_dict"])
     tokenized.apply_to(read_data_de)
-    assert tokenized.doc[2][5].text == "dass"
+    assert list(tokenized.doc)[2][5].text == "dass"
+
+
+def test_apply_to_parallel(read_data_en, load_dict):
+    tokenized = mso.MySomajo(load_dict["somajo_dict"])
+    # the tokenizer is reused for several texts
+    paragraphs = [read_data_en, "This is a sentence.", "And one more."]
+    tokenized.apply_to(paragraphs, parallel=2)
+    sents = list(tokenized.doc)
+    tokenized.apply_to(paragraphs)
+    assert [[token.text for token in sent] for sent in sents] == [
+        [token.text for token in sent] for sent in tokenized.doc
+    ]
+    assert [token.text for token in sents[-1]] == ["And", "one", "more", "."]
+
+
+def test_apply_to_paragraphs(load_dict):
+    tokenized = mso.MySomajo(load_dict["somajo_dict"])
+    # a heading without punctuation is not joined with the next paragraph
+    chunk = be.PARAGRAPH_SEP.join(["A heading", "This is a sentence."])
+    tokenized.apply_to(chunk)
+    assert [[token.text for token in sent] for sent in tokenized.doc] == [
+        ["A", "heading"],
+        ["This", "is", "a", "sentence", "."],
+    ]
+
+
+def test_assemble_output_sent_generator(read_data_en, load_dict):
+    tokenized = mso.MySomajo(load_dict["somajo_dict"])
+    tokenized.apply_to(read_data_en)
+    out_obj = mso.OutSomajo(tokenized.doc, tokenized.jobs, 0)
+    out = out_obj.assemble_output_sent()
+    assert list(out) == test_out_en
 
 
 def test_outsomajo_init(get_doc):
@@ -225,15 +258,15 @@ def test_outsomajo_init(get_doc):
 def test_assemble_output_sent(get_doc):
     out_obj = mso.OutSomajo(get_doc[0], get_doc[1], 0)
     out = out_obj.assemble_output_sent()
-    assert out == test_out_en
+    assert list(out) == test_out_en
 
 
 def test_iterate(get_doc):
     out_obj = mso.OutSomajo(get_doc[0], get_doc[1], 0)
-    out = []
+    out = tb.TokenTable()
     sent = get_doc[0][0]
     out_obj.iterate(out, sent)
-    assert out == test_out_en_sentence
+    assert list(out) == ["<s>\n"] + test_out_en_sentence + ["</s>\n"]
 
 
 def test_sentences(get_doc):
@@ -113,6 +113,32 @@ def test_init():
         assert test_obj.jobs == procs
 
 
+def test_select_components():
+    subdict = {
+        "model": "en_core_web_md",
+        "lang": "en",
+        "processors": ["tagger"],
+        "set_device": False,
+        "config": {},
+    }
+    test_obj = msp.MySpacy(subdict)
+    assert test_obj.executed == ["tok2vec", "tagger", "attribute_ruler"]
+    assert "ner" in test_obj.nlp.disabled
+    assert "parser" in test_obj.nlp.disabled
+    subdict["processors"] = ["ner"]
+    test_obj = msp.MySpacy(subdict)
+    assert test_obj.executed == ["ner"]
+    # the sentences are set by the parser if it runs, else by the senter
+    subdict["processors"] = ["senter", "parser"]
+    test_obj = msp.MySpacy(subdict)
+    assert "parser" in test_obj.executed
+    assert "senter" not in test_obj.executed
+    subdict["processors"] = ["senter"]
+    test_obj = msp.MySpacy(subdict)
+    assert "senter" in test_obj.executed
+    assert "parser" not in test_obj.executed
+
+
 def test_init_pipe(init, load_object):
     """Check if the parameters from the input dict are loaded into the
     pipe object as expected."""
@@ -130,6 +156,18 @@ def test_apply_to(load_object, get_text):
     assert str(test_obj.doc) == get_text
 
 
+def test_apply_to_list(load_object, get_text):
+    texts = [get_text, "This is a third sentence.", "And a fourth."]
+    test_obj = load_object.apply_to_list(texts, batch_size=2)
+    assert [str(doc) for doc in test_obj.doc] == texts
+
+
+def test_apply_to_list_pretokenized(load_object):
+    tokens = [["This", "isn't", "split", "."], ["And", "a", "fourth", "."]]
+    test_obj = load_object.apply_to_list(tokens)
+    assert [[token.text for token in doc] for doc in test_obj.doc] == tokens
+
+
 def test_output_sent(pipe_sent):
     """Check if output is as expected, use current output as example result.
     Additionally use doc build through spacy directly and compare output."""
@@ -159,5 +197,5 @@ def test_output_sent(pipe_sent):
     check_out = check_out_obj.assemble_output_sent()
     test_out = test_out_obj.assemble_output_tokens(test_out)
     check_out = check_out_obj.assemble_output_tokens(check_out)
-    assert test_out == check_out
-    assert test_out == check
+    assert list(test_out) == list(check_out)
+    assert list(test_out) == check
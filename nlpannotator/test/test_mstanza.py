@@ -111,7 +111,7 @@ def test_outstanza_tok(get_sample, get_out_sample):
     test_out = get_out_sample
     # compare as string not as list
     # reading in as list will add further \n
-    assert str(out) == test_out
+    assert str(list(out)) == test_out
 
 
 @pytest.mark.lang("en")
@@ -129,7 +129,7 @@ def test_outstanza_tok_pos(get_sample, get_out_sample):
     test_out = get_out_sample
     # compare as string not as list
     # reading in as list will add further \n
-    assert str(out) == test_out
+    assert str(list(out)) == test_out
 
 
 @pytest.mark.lang("en")
@@ -147,7 +147,7 @@ def test_outstanza_tok_pos_lemma(get_sample, get_out_sample):
     test_out = get_out_sample
     # compare as string not as list
     # reading in as list will add further \n
-    assert str(out) == test_out
+    assert str(list(out)) == test_out
 
 
 @pytest.mark.lang("en")
@@ -219,3 +219,22 @@ def test_sentences(get_sample):
         out_sentences = file.read()
 
     assert str(sentences) == out_sentences
+
+
+def test_get_options():
+    mydict = {
+        "lang": "en",
+        "processors": "tokenize,pos",
+        "tokenize_no_ssplit": True,
+        "stanza_tokenize": {"tokenize_batch_size": 32, "tokenize_no_ssplit": False},
+        "stanza_pos": {"pos_batch_size": 5000},
+        "stanza_sentiment": {"batch_size": None},
+    }
+    options = ma.MyStanza.get_options(mydict)
+    assert options == {
+        "lang": "en",
+        "processors": "tokenize,pos",
+        "tokenize_no_ssplit": True,
+        "tokenize_batch_size": 32,
+        "pos_batch_size": 5000,
+    }
@@ -11,13 +11,13 @@ def data_en():
 @pytest.fixture
 def test_en():
     data = [
-        "<s>",
+        "<s>\n",
         "This\tDT\tthis\n",
         "is\tVBZ\tbe\n",
         "a\tDT\ta\n",
         "sentence\tNN\tsentence\n",
         ".\tSENT\t.\n",
-        "</s>",
+        "</s>\n",
     ]
     return data
 
@@ -63,23 +63,74 @@ def test_mytreetagger_apply_to(get_doc):
     assert get_doc[0][3].lemma == "sentence"
 
 
-def test_mytreetagger_make_dict(load_dict, data_en, test_dict_doc):
+def test_mytreetagger_make_tokens(load_dict, data_en, test_dict_doc):
     annotated = mtt.MyTreetagger(load_dict)
     annotated.doc = annotated.nlp.tag_text(data_en)
-    annotated.doc = annotated._make_dict()
-    assert annotated.doc == test_dict_doc
-
-
-def test_mytreetagger_make_object(load_dict, data_en):
-    annotated = mtt.MyTreetagger(load_dict)
-    annotated.doc = annotated.nlp.tag_text(data_en)
-    annotated.doc = annotated._make_dict()
-    annotated._make_object()
+    annotated.doc = annotated._make_tokens()
+    assert [token._asdict() for token in annotated.doc] == [
+        {"text": token["word"], "pos": token["pos"], "lemma": token["lemma"]}
+        for token in test_dict_doc
+    ]
     assert annotated.doc[1].text == "is"
     assert annotated.doc[1].pos == "VBZ"
     assert annotated.doc[1].lemma == "be"
 
 
+def test_mytreetagger_make_tokens_extra():
+    # the conversion does not need the treetagger binary
+    annotated = mtt.MyTreetagger.__new__(mtt.MyTreetagger)
+    annotated.doc = [
+        "This\tDT\tthis",
+        "is\tVBZ\tbe\t0.998",
+        '<repurl text="http://a.b" />',
+    ]
+    assert annotated._make_tokens() == [
+        mtt.TreetaggerToken("This", "DT", "this"),
+        mtt.TreetaggerToken("is", "VBZ", "be"),
+        mtt.TreetaggerToken('<repurl text="http://a.b" />', be.NOT_DEF, be.NOT_DEF),
+    ]
+
+
+def test_mytreetagger_tagonly(load_dict):
+    load_dict["processors"] = "pos", "lemma"
+    annotated = mtt.MyTreetagger(load_dict)
+    assert annotated.tagonly
+    annotated.apply_to([["This", "is", "a", "sentence", "."], ["Next", "one", "."]])
+    assert [token.text for token in annotated.doc][4:6] == [".", "Next"]
+
+
+def test_get_shards():
+    data = [["This", "is", "."], ["Next", "one", "."], ["Last", "."]]
+    # the shards keep the sentences together
+    shards = mtt.MyTreetagger.get_shards(data, 2, tagonly=True)
+    assert shards == [["This", "is", "."], ["Next", "one", ".", "Last", "."]]
+    shards = mtt.MyTreetagger.get_shards(data, 4, tagonly=True)
+    assert shards == [["This", "is", "."], ["Next", "one", "."], ["Last", "."]]
+    shards = mtt.MyTreetagger.get_shards(data, 2)
+    assert shards == [["This is .", "Next one ."], ["Last ."]]
+    assert mtt.MyTreetagger.get_shards("This is .", 4) == ["This is ."]
+    assert mtt.MyTreetagger.get_shards([], 2) == [[]]
+    assert mtt.MyTreetagger.get_shards([], 2, tagonly=True) == [[]]
+
+
+def test_release(monkeypatch):
+    stopped = []
+
+    class Poll:
+        def stop_poll(self):
+            stopped.append(True)
+
+    monkeypatch.setattr(mtt.ttw, "TaggerPoll", lambda **kwargs: Poll())
+    subdict = {"processors": ["pos"], "lang": "en", "tagopt": "", "n_process": 2}
+    pool = be.ModelPool(max_models=1)
+    pool.get("treetagger", subdict, mtt.MyTreetagger)
+    # the poll is stopped when the pipeline is dropped from the pool
+    pool.get("treetagger", dict(subdict, lang="de"), mtt.MyTreetagger)
+    assert stopped == [True]
+    pool.clear()
+    assert stopped == [True, True]
+
+
 def test_outtreetagger_init(get_doc):
     out_obj = mtt.OutTreetagger(get_doc[0], get_doc[1], 0)
     assert out_obj.attrnames["proc_sent"] == "na"
@@ -91,4 +142,4 @@ def test_assemble_output_tokens(get_doc, test_en):
     out_obj = mtt.OutTreetagger(get_doc[0], get_doc[1], 0)
     out = ["<s>", "This", "is", "a", "sentence", ".", "</s>"]
     out = out_obj.assemble_output_tokens(out)
-    assert out == test_en
+    assert list(out) == test_en
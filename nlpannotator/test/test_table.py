@@ -0,0 +1,96 @@
+import pytest
+import nlpannotator.table as tb
+
+
+@pytest.fixture
+def table():
+    table = tb.TokenTable()
+    table.add_sentence(["This", "is", "a", "test", "."])
+    table.add_sentence(["It", "is", "."])
+    return table
+
+
+def test_add_sentence(table):
+    assert len(table) == 8
+    assert table.nsentences == 2
+    assert list(table.sentence) == [0, 0, 0, 0, 0, 1, 1, 1]
+    assert table.sentence_tokens() == [
+        ["This", "is", "a", "test", "."],
+        ["It", "is", "."],
+    ]
+
+
+def test_add_column(table):
+    name = table.add_column("pos", ["DT", "VBZ", "DT", "NN", ".", "PRP", "VBZ", "."])
+    assert name == "pos"
+    # repeated tags are stored once
+    assert table.vocabs["pos"] == ["DT", "VBZ", "NN", ".", "PRP"]
+    assert list(table.columns["pos"]) == [0, 1, 0, 2, 3, 4, 1, 3]
+    assert table.column("pos")[5] == "PRP"
+    # a second column of the same name is numbered
+    assert table.add_column("pos", ["x"] * 8) == "pos_2"
+    with pytest.raises(ValueError):
+        table.add_column("lemma", ["x"])
+    with pytest.raises(ValueError):
+        table.add_sentence(["More"])
+
+
+def test_lines(table):
+    table.add_column("pos", ["DT", "VBZ", "DT", "NN", ".", "PRP", "VBZ", "."])
+    lines = list(table)
+    assert lines[:3] == ["<s>\n", "This\tDT\n", "is\tVBZ\n"]
+    assert lines[6:9] == ["</s>\n", "<s>\n", "It\tPRP\n"]
+    assert lines[-1] == "</s>\n"
+    assert len(lines) == 12
+
+
+def test_from_lines(table):
+    table.add_column("pos", ["DT", "VBZ", "DT", "NN", ".", "PRP", "VBZ", "."])
+    lines = ['<text id="a">\n'] + list(table) + ["</text>\n"]
+    new_table = tb.TokenTable.from_lines(lines)
+    assert list(new_table) == list(table)
+    new_table = tb.TokenTable.from_lines(["<s>", "This\tDT", "is", "</s>", "Then"])
+    assert new_table.sentence_tokens() == [["This", "is"], ["Then"]]
+    assert new_table.column("1") == ["DT", " ", " "]
+    new_table = tb.TokenTable.from_lines(["a\tX\tY"], names=["pos"])
+    assert list(new_table.columns) == ["pos", "2"]
+
+
+def test_iter_sentences():
+    # one token per line, the sentences are separated by empty lines
+    lines = ["This\n", "is\n", "\n", "Then\n", ".\n", '<text id="b">\n', "More\n"]
+    sentences = [[row[0] for row in sent] for sent in tb.iter_sentences(lines)]
+    assert sentences == [["This", "is"], ["Then", "."], ["More"]]
+    lines = ['<s id="1">\n', "A\tX\n", "\n", "B\tY\n", "</s>\n"]
+    assert list(tb.iter_sentences(lines)) == [[["A", "X"], ["B", "Y"]]]
+    # tokens that look like markup are kept, escaped tokens are told apart
+    lines = ["<s>\n", "<b>\tX\n", "<p>\n", "&lt;br/&gt;\tY\n", "</s>\n"]
+    assert list(tb.iter_sentences(lines, escaped=True)) == [
+        [["<b>", "X"], ["<br/>", "Y"]]
+    ]
+
+
+def test_concat(table):
+    table.add_column("pos", ["DT", "VBZ", "DT", "NN", ".", "PRP", "VBZ", "."])
+    new_table = tb.TokenTable.concat([table, table])
+    assert new_table.nsentences == 4
+    assert list(new_table) == list(table) + list(table)
+    assert len(tb.TokenTable.concat([])) == 0
+
+
+def test_split(table):
+    table.add_column("pos", ["DT", "VBZ", "DT", "NN", ".", "PRP", "VBZ", "."])
+    first, empty, second = table.split([1, 0, 1])
+    assert first.sentence_tokens() == [["This", "is", "a", "test", "."]]
+    assert len(empty) == 0
+    assert second.column("pos") == ["PRP", "VBZ", "."]
+    assert list(tb.TokenTable.concat([first, empty, second])) == list(table)
+
+
+def test_to_dict(table):
+    table.add_column("pos", ["DT", "VBZ", "DT", "NN", ".", "PRP", "VBZ", "."])
+    table.add_column("pos", ["x"] * 8)
+    mydict = table.to_dict()
+    assert mydict["sentences"][1] == ["It", "is", "."]
+    assert list(mydict["columns"]) == ["pos", "pos_2"]
+    assert list(tb.TokenTable.from_dict(mydict)) == list(table)